@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import argparse
+import numpy as np
+import pandas as pd
+from spotilities import newsflash
+import sys
+
+
+"""
+__PARAMETERS__ (to main program: all non-positional key/value pairs):
+
+    1. input-file    : template spreadsheet; default = gwas_subset.tsv
+    2. output        : filepath of synthetic spreadsheet
+    3. rows          : number of rows to generate
+    4. column-name   : column holding source ontology terms; default = MAPPED_TRAIT_URI
+    5. file-format   : spreadsheet file format (both input and output): 'csv' or 'tsv'; default = 'tsv'
+    6. seed          : random seed, for reproducible spreadsheets; default = 0
+
+Scales a template (such as gwas_subset.tsv) up to any number of rows, for benchmarking. As in the GWAS catalogue, source
+term cells repeat heavily: each row draws its cell from a pool of distinct cells with a Zipf-like frequency, and the
+pool, along with the vocabulary of source IRIs behind it, grows sub-linearly with the number of rows. The number of
+IRIs per cell follows the distribution found in the template; all other columns are copied from random template rows.
+"""
+
+
+def synthesise(template_file, output_file, row_count, column_name, separator, seed, block_size=100000):
+    rng = np.random.RandomState(seed)
+    template_df = pd.read_csv(template_file, sep=separator, keep_default_na=False, dtype=str)
+    template_cells = template_df[column_name]
+    template_terms = [[t.strip() for t in cell.split(',')] if cell else [] for cell in template_cells]
+    term_counts = np.array([len(terms) for terms in template_terms])
+    vocabulary = list(dict.fromkeys(t for terms in template_terms for t in terms))
+
+    """ Heaps-like growth of the vocabulary, and of the pool of distinct cells, with the number of rows """
+    scale = max(float(row_count) / len(template_df), 1.0)
+    vocabulary_size = int(len(vocabulary) * scale ** 0.6)
+    vocabulary += ['http://www.ebi.ac.uk/efo/EFO_9%06d' % v for v in range(vocabulary_size - len(vocabulary))]
+    pool_size = int(len(set(template_cells)) * scale ** 0.6)
+    newsflash("Generating %d rows from a pool of %d distinct cells over %d source IRIs ..." %
+              (row_count, pool_size, len(vocabulary)))
+    cell_pool = list(dict.fromkeys(template_cells))
+    term_order = rng.permutation(len(vocabulary))
+    while len(cell_pool) < pool_size:
+        cell_size = term_counts[rng.randint(len(term_counts))]
+        term_ranks = np.minimum(rng.zipf(1.3, cell_size) - 1, len(vocabulary) - 1)
+        cell_pool.append(', '.join(dict.fromkeys(vocabulary[term_order[r]] for r in term_ranks)))
+    """ Shuffle, so that the commonest cells are not simply those of the template """
+    cell_pool = np.array(cell_pool, dtype=object)[rng.permutation(len(cell_pool))]
+
+    written = 0
+    while written < row_count:
+        block_rows = min(block_size, row_count - written)
+        block_df = template_df.iloc[rng.randint(len(template_df), size=block_rows)].reset_index(drop=True)
+        cell_ranks = np.minimum(rng.zipf(1.1, block_rows) - 1, len(cell_pool) - 1)
+        block_df[column_name] = cell_pool[cell_ranks]
+        block_df.to_csv(output_file, sep=separator, index=False, header=written == 0, mode='w' if written == 0 else 'a')
+        written += block_rows
+        newsflash("Written %d rows ..." % written)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='GWAS synthesiser',
+                                     description='Scales a template spreadsheet up to a synthetic one of any size.')
+    parser.add_argument('-i', '--input-file', default='gwas_subset.tsv', help='template spreadsheet filepath')
+    parser.add_argument('-o', '--output', required=True, help='synthetic spreadsheet filepath')
+    parser.add_argument('-r', '--rows', type=int, required=True, help='number of rows to generate')
+    parser.add_argument('-c', '--column-name', default='MAPPED_TRAIT_URI',
+                        help='name or heading of column containing source ontology terms')
+    parser.add_argument('-f', '--file-format', choices=['csv', 'tsv'], default='tsv',
+                        help='file format (both input and output)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='random seed')
+
+    if len(sys.argv) < 2:
+        parser.print_help(sys.stderr)
+        newsflash()
+        sys.exit(0)
+
+    args = parser.parse_args()
+    synthesise(args.input_file, args.output, args.rows, args.column_name, ',' if args.file_format == 'csv' else '\t',
+               args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+import argparse
+import gc
+import gwas_synth
+import json
+import ontomapper
+import os
+import platform
+import socket
+from spotilities import newsflash
+import subprocess
+import sys
+import threading
+import time
+
+
+"""
+__PARAMETERS__ (to main program: all non-positional key/value pairs):
+
+    1. sizes         : numbers of spreadsheet rows to benchmark; default = 10000 100000 1000000
+    2. layouts       : layouts to benchmark; default = all five
+    3. engines       : augment engines to benchmark; default = loop and columnar
+    4. target        : target ontologies; default = doid mesh ncit
+    5. latency       : seconds of simulated latency per OxO stub reply; default = 0.05
+    6. number        : no. of query terms per OxO request; default = 100
+    7. oxo-threads   : no. of concurrent OxO requests; default = 4
+    8. data-dir      : directory holding synthetic spreadsheets (generated if missing); default = ./bench_data
+    9. results       : JSON file to which results are written; default = bench_results.json
+    10. compare      : earlier results file, to compare timings against
+
+Reproducible benchmark of the ontomapper.py pipeline: synthetic GWAS-like spreadsheets (gwas_synth.py) are mapped
+against a local OxO stand-in (oxo_stub.py) with a configurable latency, and the time and peak resident memory of each
+stage (parse, map, augment, output) are recorded, for every layout and augment engine.
+"""
+
+
+class RssSampler(object):
+    """ Polls the resident set size of this process in a background thread, recording its peak (Linux only) """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.peak = None
+        self.running = False
+
+    def rss(self):
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * self.page_size
+        except (IOError, OSError):
+            return None
+
+    def sample(self):
+        while self.running:
+            rss = self.rss()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start = self.rss()
+        self.peak = self.start
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.running = False
+        self.thread.join()
+        end = self.rss()
+        if end is not None and (self.peak is None or end > self.peak):
+            self.peak = end
+
+
+def measure(results, stage, rows, function, *args, **kwargs):
+    """ Run one pipeline stage, appending its wall-clock time and peak memory to the results list """
+    gc.collect()
+    with RssSampler() as sampler:
+        t0 = time.time()
+        value = function(*args, **kwargs)
+        seconds = time.time() - t0
+    result = dict(stage, rows=rows, seconds=round(seconds, 4),
+                  peak_rss_mb=None if sampler.peak is None else round(sampler.peak / 1e6, 1),
+                  rss_growth_mb=None if sampler.peak is None else round((sampler.peak - sampler.start) / 1e6, 1))
+    newsflash("BENCH %s" % json.dumps(result))
+    results.append(result)
+    return value
+
+
+def start_stub(latency):
+    """ Launch oxo_stub.py on a free local port, in a separate process, and wait until it is listening """
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    stub = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'oxo_stub.py'),
+                             '--port', str(port), '--latency', str(latency)], stderr=subprocess.DEVNULL)
+    for attempt in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return stub, 'http://127.0.0.1:%d/api/search' % port
+
+
+def run_benchmarks(sizes, layouts, engines, target, latency, number, oxo_threads, data_dir):
+    results = []
+    stub, oxo_url = start_stub(latency)
+    try:
+        for rows in sizes:
+            spreadsheet = os.path.join(data_dir, 'gwas_synth_%d.tsv' % rows)
+            if not os.path.exists(spreadsheet):
+                os.makedirs(data_dir, exist_ok=True)
+                gwas_synth.synthesise(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gwas_subset.tsv'),
+                                      spreadsheet, rows, 'MAPPED_TRAIT_URI', '\t', 0)
+            column_dict = {'index': None, 'name': 'MAPPED_TRAIT_URI'}
+            ss_dict = measure(results, {'stage': 'parse'}, rows, ontomapper.parse_ss, spreadsheet, '\t', column_dict)
+            iri_map = ss_dict['unique_iris']
+            measure(results, {'stage': 'map', 'unique_iris': len(iri_map)}, rows, ontomapper.map_iris, iri_map,
+                    sorted(target), 1, False, oxo_url, number, False, oxo_threads=oxo_threads)
+            for layout in layouts:
+                for engine in engines:
+                    augment_engine = ontomapper.augment_columnar if engine == 'columnar' else ontomapper.augment
+                    stage = {'layout': layout, 'engine': engine}
+                    augmented = measure(results, dict(stage, stage='augment'), rows, augment_engine,
+                                        ss_dict['pandafued'], iri_map, layout, column_dict['index'], True, 'curie')
+                    with open(os.devnull, 'w') as null_output:
+                        measure(results, dict(stage, stage='output'), rows, augmented.to_csv, null_output,
+                                index=False, sep='\t')
+                    del augmented
+            del ss_dict, iri_map
+    finally:
+        stub.terminate()
+        stub.wait()
+    return results
+
+
+def compare_results(results, previous_results):
+    """ Print the ratio of each stage's time to that of the matching stage in an earlier results file """
+    def stage_key(result):
+        return tuple(result.get(k) for k in ['rows', 'stage', 'layout', 'engine'])
+    previous = {stage_key(r): r for r in previous_results}
+    newsflash()
+    newsflash("%-8s %-8s %-13s %-9s %10s %10s %7s" % ('rows', 'stage', 'layout', 'engine', 'before/s', 'after/s',
+                                                      'ratio'))
+    for result in results:
+        before = previous.get(stage_key(result))
+        if before is None:
+            continue
+        newsflash("%-8d %-8s %-13s %-9s %10.3f %10.3f %7.2f" % (
+            result['rows'], result['stage'], result.get('layout') or '-', result.get('engine') or '-',
+            before['seconds'], result['seconds'], result['seconds'] / max(before['seconds'], 1e-6)))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Ontobench',
+                                     description='Times each stage of the ontomapper.py pipeline on synthetic data.')
+    parser.add_argument('-r', '--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='space-separated list of spreadsheet row counts')
+    parser.add_argument('-l', '--layouts', nargs='+',
+                        default=['in-situ', 'uni-row', 'multi-row', 'uni-column', 'multi-column'],
+                        help='space-separated list of layouts')
+    parser.add_argument('-y', '--engines', nargs='+', choices=['loop', 'columnar'], default=['loop', 'columnar'],
+                        help='space-separated list of augment engines')
+    parser.add_argument('-t', '--target', nargs='+', default=['doid', 'mesh', 'ncit'],
+                        help='space-separated list of target ontology prefixes')
+    parser.add_argument('-a', '--latency', type=float, default=0.05, help='seconds of latency per OxO stub reply')
+    parser.add_argument('-n', '--number', type=int, default=100, help='number of query terms per OxO request')
+    parser.add_argument('-j', '--oxo-threads', type=int, default=4, help='number of concurrent OxO requests')
+    parser.add_argument('-d', '--data-dir', default='bench_data', help='directory holding synthetic spreadsheets')
+    parser.add_argument('-o', '--results', default='bench_results.json', help='JSON results filepath')
+    parser.add_argument('-c', '--compare', help='earlier JSON results file to compare against')
+    args = parser.parse_args()
+
+    """ Progress reports from the pipeline itself would drown the benchmark results """
+    ontomapper.newsflash = lambda msg=None, verbose=True: None
+    results = run_benchmarks(args.sizes, args.layouts, args.engines, args.target, args.latency, args.number,
+                             args.oxo_threads, args.data_dir)
+    with open(args.results, 'w') as results_file:
+        json.dump({'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                            'pandas': ontomapper.pd.__version__, 'platform': platform.platform(),
+                            'latency': args.latency, 'number': args.number, 'oxo_threads': args.oxo_threads},
+                   'results': results}, results_file, indent=1)
+    newsflash("Results written to %s" % args.results)
+    if args.compare is not None:
+        with open(args.compare) as previous_file:
+            compare_results(results, json.load(previous_file)['results'])
+
+
+if __name__ == "__main__":
+    main()
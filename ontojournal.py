@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+
+
+"""
+Append-only journal of completed OxO batches, so that a long mapping run that dies part-way may be resumed.
+
+The journal is a JSON-lines file: a header line holding the run parameters, then one line per batch of source IRIs that
+OxO answered, with the raw search results, appended (and flushed) as soon as the batch completes. On resuming, every
+IRI in a journalled batch counts as done, and is filled in from the journal rather than re-queried, so that the pending
+work is simply whatever has not been journalled; once all batches are in, the journal alone can feed a re-run of the
+augment stage with a different layout, without any calls to OxO. A line left half-written by a crash is discarded.
+Each batch line records the OxO distance it was queried at, as source IRIs may be escalated from one distance to the
+next; lines without one were queried at the run's own distance.
+"""
+
+
+""" Parameters that change OxO's answers: a journal cannot be resumed if any of these differ """
+MAPPING_PARAMS = ['target', 'distance']
+
+
+def open_journal(journal_file, run_params, resume):
+    """
+    Open a journal for appending: when resuming (and the file exists), load the batches already completed, checking
+    that the journal was written with the same mapping parameters; otherwise start a new journal
+    :param journal_file run_params resume:
+    :return journal, as a dictionary holding the file handle, a lock and the search results of journalled IRIs:
+    """
+    journal = {'lock': threading.Lock(), 'results': {}, 'batches': 0}
+    if resume and os.path.exists(journal_file):
+        good_bytes = 0
+        with open(journal_file, 'rb') as journal_input:
+            for journal_line in journal_input:
+                try:
+                    entry = json.loads(journal_line.decode('utf-8'))
+                except ValueError:
+                    break
+                if not journal_line.endswith(b'\n'):
+                    break
+                good_bytes += len(journal_line)
+                if 'params' in entry:
+                    mismatched = [p for p in MAPPING_PARAMS if entry['params'].get(p) != run_params.get(p)]
+                    if mismatched:
+                        raise SystemExit("Journal %s was written with different %s: cannot resume" %
+                                         (journal_file, ', '.join(mismatched)))
+                    continue
+                """ IRIs absent from a batch's results were not known to OxO: that is an answer too """
+                batch_results = dict.fromkeys(entry['iris'])
+                batch_results.update({result['queryId']: result for result in entry['results']})
+                journal['results'].setdefault(entry.get('distance', run_params.get('distance')), {}).update(
+                    batch_results)
+                journal['batches'] += 1
+        os.truncate(journal_file, good_bytes)
+        journal['handle'] = open(journal_file, 'a', encoding='utf-8')
+        write_line(journal, {'params': run_params, 'resumed': time.strftime('%Y-%m-%dT%H:%M:%S')})
+    else:
+        journal['handle'] = open(journal_file, 'w', encoding='utf-8')
+        write_line(journal, {'params': run_params, 'started': time.strftime('%Y-%m-%dT%H:%M:%S')})
+    return journal
+
+
+def write_line(journal, entry):
+    with journal['lock']:
+        journal['handle'].write(json.dumps(entry) + '\n')
+        journal['handle'].flush()
+
+
+def journalled_results(journal, source_iris, distance):
+    """
+    Split source IRIs into those already answered in the journal, at the given distance, and those still to be queried
+    :return list of journalled OxO search results, and list of IRIs still pending:
+    """
+    distance_results = journal['results'].get(distance, {})
+    search_results = []
+    pending_iris = []
+    for source_iri in source_iris:
+        if source_iri not in distance_results:
+            pending_iris.append(source_iri)
+        elif distance_results[source_iri] is not None:
+            search_results.append(distance_results[source_iri])
+    return search_results, pending_iris
+
+
+def record_batch(journal, batch_iris, search_results, distance):
+    """ Append a completed batch, queried at the given distance, to the journal """
+    write_line(journal, {'distance': distance, 'iris': batch_iris, 'results': search_results})
+
+
+def close_journal(journal):
+    journal['handle'].close()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import collections
+import configparser
+import itertools
+import ontomapper
+import os
+from spotilities import config_or_bust
+import threading
+
+
+"""
+Importable mapping API, for Python services that would otherwise run ontomapper.py in a subprocess, and re-parse its
+output.
+
+An OntoMapper is built from the same parameters as ontomapper.py (or from its config file, by from_config), and keeps
+its OxO session and the mappings of recently seen source IRIs in memory, between calls:
+
+    mapper = ontolib.OntoMapper.from_config('ontomapper.ini', layout='uni-column')
+    iri_map = mapper.resolve(['http://www.ebi.ac.uk/efo/EFO_0000378'])
+    augmented_df = mapper.augment_frame(gwas_df)
+
+resolve returns entries of the IRI dictionary, as map_iris fills them in; augment_frame takes and returns DataFrames,
+as augment_columns does, without any spreadsheet text in between. Mappings are held in a bounded, least recently used
+dictionary, and concurrent calls for the same source IRIs, from different threads, are coalesced into one OxO query.
+"""
+
+
+""" Source IRIs whose mappings are held in memory, by default """
+DEFAULT_LRU_SIZE = 1000000
+
+
+class OntoMapper(object):
+    """
+    Warm mapping state: the mappings of recently resolved source IRIs, the IRIs being queried right now, and a
+    keep-alive OxO session; plus the defaults with which DataFrames are augmented
+    """
+
+    def __init__(self, target, distance=1, oxo_url='https://www.ebi.ac.uk/spot/oxo/api/search', number=100,
+                 oxo_threads=4, column_name='MAPPED_TRAIT_URI', layout='multi-column', keep=True, engine='loop',
+                 uri_format='curie', prefixes=None, cache_file=None, cache_ttl=None, cache_size=None,
+                 lru_size=DEFAULT_LRU_SIZE, verbose=False):
+        self.target = sorted(target)
+        self.distance = distance
+        self.oxo_url = oxo_url
+        self.number = number
+        self.oxo_threads = oxo_threads
+        self.column_name = [column_name] if isinstance(column_name, str) else list(column_name)
+        self.layout = [layout] if isinstance(layout, str) else list(layout)
+        self.keep = keep
+        self.engine = engine
+        self.uri_format = ontomapper.IriFormatter(uri_format, prefixes)
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.lru_size = lru_size
+        self.verbose = verbose
+        self.session = ontomapper.oxo_session(oxo_threads)
+        self.iri_map = collections.OrderedDict()
+        self.in_flight = set()
+        """ Source IRIs that callers are waiting on, which are not to be evicted before they have been handed over """
+        self.pinned = collections.Counter()
+        self.condition = threading.Condition()
+        self.tally = {'requests': 0, 'upstream_queries': 0, 'queried_iris': 0, 'coalesced_iris': 0,
+                      'evicted_iris': 0}
+
+    @classmethod
+    def from_config(cls, config_file, **overrides):
+        """
+        Build a mapper from an ontomapper.py config file: its [Params], [Targets] and [Prefixes] sections, any of whose
+        values may be overridden by keyword arguments
+        """
+        ontoconfig = configparser.ConfigParser(os.environ)
+        ontoconfig.optionxform = str
+        if not ontoconfig.read(config_file):
+            raise SystemExit("Config file %s could not be read" % config_file)
+        cfg_sect_lookup = config_or_bust(ontoconfig, 'Params')
+        spurious_items = set(ontoconfig.items('DEFAULT'))
+        params = {'target': list(dict(set(ontoconfig.items('Targets')) - spurious_items).values())}
+        if ontoconfig.has_section('Prefixes'):
+            params['prefixes'] = dict(set(ontoconfig.items('Prefixes')) - spurious_items)
+        cfg_distance = cfg_sect_lookup('distance', 'string')
+        if cfg_distance is not None:
+            """ A mapper maps at one distance only: the greatest configured """
+            params['distance'] = max(int(d) for d in cfg_distance.split())
+        for param, cfg_key, cfg_type in [('oxo_url', 'oxo_url', 'string'), ('number', 'query_term_number', 'int'),
+                                         ('oxo_threads', 'oxo_threads', 'int'), ('keep', 'keep', 'boolean'),
+                                         ('engine', 'engine', 'string'), ('uri_format', 'uri_format', 'string'),
+                                         ('cache_file', 'cache_file', 'string'), ('cache_ttl', 'cache_ttl', 'float'),
+                                         ('cache_size', 'cache_size', 'int'), ('lru_size', 'lru_size', 'int'),
+                                         ('verbose', 'verbose', 'boolean')]:
+            cfg_value = cfg_sect_lookup(cfg_key, cfg_type)
+            if cfg_value is not None:
+                params[param] = cfg_value
+        cfg_layout = cfg_sect_lookup('layout', 'string')
+        if cfg_layout is not None:
+            params['layout'] = cfg_layout.split()
+        cfg_column_name = cfg_sect_lookup('column_name', 'string')
+        if cfg_column_name is not None:
+            params['column_name'] = cfg_column_name.strip().splitlines()
+        params.update(overrides)
+        return cls(**params)
+
+    def resolve(self, source_iris):
+        """
+        Map source IRIs, querying OxO only for those neither held from before nor being queried for another caller
+        :return IRI dictionary of the given source IRIs, in order (None for IRIs unknown to OxO, or failing):
+        """
+        resolved = {}
+        with self.condition:
+            self.tally['requests'] += 1
+            query_iris = []
+            awaited_iris = []
+            for source_iri in dict.fromkeys(source_iris):
+                if source_iri in self.iri_map:
+                    self.iri_map.move_to_end(source_iri)
+                    resolved[source_iri] = self.iri_map[source_iri]
+                elif source_iri in self.in_flight:
+                    awaited_iris.append(source_iri)
+                else:
+                    self.in_flight.add(source_iri)
+                    query_iris.append(source_iri)
+            self.pinned.update(awaited_iris)
+            self.tally['coalesced_iris'] += len(awaited_iris)
+        if query_iris:
+            query_dict = dict.fromkeys(query_iris)
+            failed_iris = set(query_iris)
+            try:
+                failed_iris = ontomapper.map_iris(query_dict, self.target, self.distance, False, self.oxo_url,
+                                                  self.number, self.verbose, self.cache_file, self.cache_ttl,
+                                                  self.cache_size, self.oxo_threads, session=self.session)
+            finally:
+                """ IRIs that OxO kept failing on are not held, so that a later call may try them again """
+                with self.condition:
+                    self.in_flight.difference_update(query_iris)
+                    self.iri_map.update({iri: query_dict[iri] for iri in query_iris if iri not in failed_iris})
+                    self.tally['upstream_queries'] += 1
+                    self.tally['queried_iris'] += len(query_iris)
+                    self.condition.notify_all()
+            resolved.update(query_dict)
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_flight.isdisjoint(awaited_iris))
+            resolved.update({iri: self.iri_map.get(iri) for iri in awaited_iris})
+            for source_iri in awaited_iris:
+                self.pinned[source_iri] -= 1
+                if not self.pinned[source_iri]:
+                    del self.pinned[source_iri]
+            self.evict()
+        return {source_iri: resolved[source_iri] for source_iri in source_iris}
+
+    def evict(self):
+        """ Drop the least recently used mappings beyond lru_size, bar those that callers are still waiting on """
+        surplus = len(self.iri_map) - self.lru_size
+        if surplus <= 0:
+            return
+        evicted_iris = [iri for iri in itertools.islice(self.iri_map, surplus + len(self.pinned))
+                        if iri not in self.pinned][:surplus]
+        for source_iri in evicted_iris:
+            del self.iri_map[source_iri]
+        self.tally['evicted_iris'] += len(evicted_iris)
+
+    def augment_frame(self, panda_input, column_name=None, layout=None, keep=None):
+        """
+        Augment a DataFrame, whose source term column(s) (given by name, by default those of the mapper) hold comma-
+        separated source IRIs, as ontomapper.py would augment the spreadsheet it was read from
+        :return augmented DataFrame:
+        """
+        ss_columns, layouts = ontomapper.source_columns(
+            None, self.column_name if column_name is None else [column_name] if isinstance(column_name, str) else
+            list(column_name), self.layout if layout is None else [layout] if isinstance(layout, str) else list(layout))
+        if len(layouts) != len(ss_columns):
+            raise ValueError("Give one layout for all source term columns, or one per column")
+        ontomapper.resolve_columns(list(panda_input.columns), ss_columns)
+        """ Missing source terms are empty strings to augment, as when read from a spreadsheet """
+        source_frame = panda_input
+        if any(panda_input.iloc[:, column['index']].isna().any() for column in ss_columns):
+            source_frame = panda_input.copy()
+            for column in ss_columns:
+                source_frame.iloc[:, column['index']] = source_frame.iloc[:, column['index']].fillna('')
+        source_iris = [iri for column in ss_columns
+                       for cell in ontomapper.pd.unique(source_frame.iloc[:, column['index']])
+                       for iri in ontomapper.split_terms(cell)]
+        augment_engine = ontomapper.augment_columnar if self.engine == 'columnar' else ontomapper.augment
+        return ontomapper.augment_columns(source_frame, self.resolve(source_iris), ss_columns, layouts,
+                                          self.keep if keep is None else keep, self.uri_format, augment_engine)
+
+    def status(self):
+        with self.condition:
+            return dict(self.tally, held_iris=len(self.iri_map), in_flight_iris=len(self.in_flight))
+
+    def close(self):
+        self.session.close()
@@ -1,17 +1,36 @@
 #!/usr/bin/env python3
 
 import argparse
-import io
+import collections
+import concurrent.futures
+import csv
 import json
 import configparser
+import datetime
+import gzip
+import io
+import ontojournal
+import ontometrics
 import os
-import pandas as pd
+import oxocache
+import random
+import ontowriter
 import re
 import requests
 from spotilities import newsflash
 from spotilities import config_or_bust
+from spotilities import fetch_spreadsheet
+from spotilities import lazy_import
+from spotilities import stream_spreadsheet
 import sys
+import threading
 import time
+import urllib.parse
+
+""" Not needed (nor imported) in mapping-only mode, in which start-up time counts """
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+oxo_index = lazy_import('oxo_index')
 
 
 """
@@ -19,15 +38,20 @@ __PARAMETERS__ (to main program: all non-positional key/value pairs, to be initi
 
     1. input-file      : URL or filename; default = online GWAS spreadsheet
     2. output          : filename; default = standard output
+    2a. output-format  : output spreadsheet format: 'csv', 'tsv', 'parquet' or 'arrow'; default = from output filename
+                         extension, else file-format
+    2b. compression    : output compression: 'none', 'gzip' or 'zstd'; default = from output filename extension
     3. layout          : layout of new entries in output spreadsheet: 'in-situ', 'uni-column', 'multi-column', 'uni-row'
-                         or 'multi-row'; default = 'multi-column'
-    4. file-format     : input / output spreadsheet file format: 'csv' or 'tsv'; default = 'tsv'
+                         or 'multi-row'; default = 'multi-column' (one per source column, if there are several)
+    4. file-format     : input / output spreadsheet file format: 'csv' or 'tsv'; default = 'tsv' (Parquet and Arrow
+                         input are recognised by filename extension)
     5. column-index    : column index (starting at 0) to parse for source IRIs; overrides column-name if supplied
     6. column-name     : mutually exlusive alternative to column-index; default replaces prior column-index default
+                         (either may list several source columns, whose IRIs are mapped together)
     7. keep/no-keep    : whether to retain column containing source IRIs in output; boolean, default = no
     8. target          : ontolog[y|ies] to search for equivalent terms; default = MeSH
     9. uri-format      : return format of target IRIs (curies, long form, etc.); default = long form
-    10. distance       : OxO distance: 1, 2 or 3; default = 1
+    10. distance       : OxO distance: 1, 2 or 3; default = 1 (or several, for one output per distance)
     11. oxo_url        : URL of OxO web service; default = public OxO server
     12. paxo/no-paxo   : use 'experimental' PAXO code?; boolean, default = no
     13. config         : configuration file path
@@ -62,49 +86,75 @@ __FUNCTIONS__
 """
 
 
-def parse_ss(spreadsheet, separator, column_dict):
+def parse_ss(spreadsheet, separator, column_dict, download_dir=None, input_format=None, lazy=False,
+             low_memory=False):
+    """
+    Only the source term column(s) are read to start with, to collect the unique source IRIs; the other columns are
+    read afterwards, around them, either at once (as 'pandafued') or, if lazy, when the returned 'load_frame' is
+    called. column_dict may be a list of column dictionaries, for several source columns: their IRIs are pooled. In
+    low-memory mode, the source columns and other repetitive text columns are held as categoricals
+    """
     ss_dict = {}
     iri_map = {}
+    column_dicts = column_dict if isinstance(column_dict, list) else [column_dict]
     try:
         # newsflash("Spreadsheet location is %s" % spreadsheet)
         # newsflash("Column index is %d" % column_dict['index'])
 
-        url_bool = re.compile('[a-zA-Z](\w|[-+.])*://.*')
-        # filestuff = None
-        if url_bool.match(spreadsheet):
-            t0 = time.time()
-            newsflash("Getting spreadsheet from URL ...")
-            r = requests.get(spreadsheet, allow_redirects=True)
-            t1 = time.time()
-            newsflash("It took %.2f seconds to retrieve the spreadsheet" % float(t1 - t0))
-            filestuff = io.StringIO(r.content.decode('utf-8'))
-        else:
-            filestuff = spreadsheet
+        filestuff = open_spreadsheet(spreadsheet, download_dir)
+        header = read_header(filestuff, input_format, separator)
+        resolve_columns(header, column_dicts)
+        colnos = sorted({column['index'] for column in column_dicts})
 
-        newsflash("Pandafying spreadsheet ...")
-        source_df = pd.read_csv(filestuff, sep=separator, low_memory=False, keep_default_na=False)
-        if column_dict['index'] is None:
-            column_dict['index'] = source_df.columns.get_loc(column_dict['name'])
-        else:
-            column_dict['name'] = source_df.columns[column_dict['index']]
-        colno = column_dict['index']
+        newsflash("Pandafying source term column(s) ...")
+        with ontometrics.span('parse', columns='source'):
+            if low_memory and input_format not in {'parquet', 'arrow'}:
+                source_df = read_categorised(filestuff, separator, colnos)
+            else:
+                source_df = read_columns(filestuff, input_format, separator, colnos).fillna('')
+        source_columns = {colno: source_df.iloc[:, c] for c, colno in enumerate(colnos)}
+        ontometrics.count('rows_in', len(source_df))
+        del source_df
 
         newsflash("Getting source terms ...")
-        source_iris = source_df.iloc[:, colno]
-        # iri_lists = source_iris.apply(lambda x: x.split(", "))
         """
-        1. Return empty array if empty string.
-        2. Split by comma only, then remove spaces afterwards: more robust!
+        Source IRIs are interned in one vectorised pass per column: each distinct cell is split, by comma only, then
+        stripped of spaces (empty cells holding no IRIs); the dictionary of unique IRIs keeps their order of first
+        appearance, column by column
         """
-        newsflash("Breaking source term strings into lists ...")
-        # iri_lists = source_iris.apply(lambda x: [] if x == '' else x.split(", "))
-        iri_lists = source_iris.apply(lambda x: [] if x == '' else list(map(lambda w: w.strip(), x.split(","))))
-        """ Use nested lambdas to collect source IRIs from Series of lists """
-        newsflash("Generate dictionary keyed on unique source terms ...")
-        iri_lists.apply(lambda x, y: list(map(lambda z: y.update({z: None}), x)), args=[iri_map])
+        for colno in [column['index'] for column in column_dicts]:
+            with ontometrics.span('extract_iris', column=header[colno]):
+                cell_codes, unique_cells = pd.factorize(source_columns[colno])
+                unique_cells = np.asarray(unique_cells, dtype=object)
+                iri_map.update(cell_iris(unique_cells))
+            if low_memory:
+                """ Only the codes of each row's cell are kept, plus the distinct cells themselves """
+                source_columns[colno] = pd.Series(pd.Categorical.from_codes(cell_codes, unique_cells),
+                                                  name=source_columns[colno].name)
         newsflash("Dictionary generated!")
-        ss_dict.update({'pandafued': source_df})
+
+        def load_frame():
+            newsflash("Pandafying remaining columns ...")
+            other_columns = [c for c in range(len(header)) if c not in source_columns]
+            with ontometrics.span('parse', columns='other'):
+                if not other_columns:
+                    source_df = pd.DataFrame(index=source_columns[colnos[0]].index)
+                elif low_memory and input_format not in {'parquet', 'arrow'}:
+                    source_df = read_categorised(filestuff, separator, other_columns)
+                elif low_memory:
+                    source_df = categorise_columns(read_columns(filestuff, input_format, separator, other_columns))
+                else:
+                    source_df = read_columns(filestuff, input_format, separator, other_columns)
+                for colno in colnos:
+                    source_df.insert(colno, header[colno], source_columns[colno])
+            if filestuff != spreadsheet and download_dir is None:
+                os.remove(filestuff)
+            return source_df
+
         ss_dict.update({'unique_iris': iri_map})
+        ss_dict.update({'load_frame': load_frame})
+        if not lazy:
+            ss_dict.update({'pandafued': load_frame()})
         newsflash("Returning from function 'parse_ss' ...")
     except requests.exceptions.InvalidSchema as is_error:
         """ pandas should have coped with distinguishing text file from URL already """
@@ -116,54 +166,306 @@ def parse_ss(spreadsheet, separator, column_dict):
     return ss_dict
 
 
-def map_iris(iri_dict, target_ontologies, distance, use_paxo, oxo_inner_url, query_size, verbose):
+def cell_iris(unique_cells):
+    """ Source IRIs of an array of distinct cells, split by comma and stripped, in order of first appearance """
+    source_terms = pd.Series(unique_cells[unique_cells != ''], dtype=object).str.split(',').explode()
+    return dict.fromkeys(pd.unique(source_terms.str.strip()))
+
+
+""" Tuning of OxO requests: timeout, retries with jittered exponential backoff, and what counts as a fast reply """
+OXO_TIMEOUT_SECONDS = 120
+OXO_MAX_RETRIES = 5
+OXO_BACKOFF_SECONDS = 0.5
+OXO_MAX_BACKOFF_SECONDS = 30
+OXO_FAST_SECONDS = 5.0
+OXO_MAX_REPLY_BYTES = 20000000
+
+
+class OxoQueryError(Exception):
+    pass
+
+
+def query_oxo(session, oxo_inner_url, batch_iris, target_ontologies, distance, query_size, verbose):
+    """
+    POST a single batch of source IRIs to OxO, following any paging links in the replies; HTTP errors, timeouts and
+    replies without search results raise an exception, so that the batch may be retried
+    :return list of OxO search results, number of calls made to the OxO web API, and bytes received:
+    """
     quantified_url = "%s?size=%d" % (oxo_inner_url, query_size)
-    data = {'ids': list(iri_dict.keys()), 'mappingTarget': target_ontologies}
-    json_strings = []
+    data = {'ids': batch_iris, 'mappingTarget': target_ontologies}
     # data['distance'] = '1' if threshold >= 100 else '2' if threshold >= 75 else '3' if threshold >= 50 else ''
     data['distance'] = distance
     """ If boundary less than 50%, throw 'confidence too low' error: need to code! """
+    search_results = []
     oxo_hit_counter = 0
+    reply_bytes = 0
     while quantified_url is not None:
-        reply = requests.post(quantified_url, data)
+        with ontometrics.span('oxo_request', query_terms=len(batch_iris)):
+            reply = session.post(quantified_url, data, timeout=OXO_TIMEOUT_SECONDS)
+            json_content = reply.content
         oxo_hit_counter += 1
-        json_content = reply.content
+        reply_bytes += len(json_content)
+        ontometrics.count('oxo_calls')
+        ontometrics.count('oxo_bytes', len(json_content))
+        reply.raise_for_status()
         json_string = json.loads(json_content)
         newsflash(json_string, verbose)
-        json_strings.append(json_string)
-        try:
-            these_results = json_string["_embedded"]["searchResults"]
-        except:
-            newsflash("IRI map load aborted: OxO hit %d times, with %d query terms" %
-                           (oxo_hit_counter, oxo_hit_counter * query_size))
-            raise
-        for this_result in these_results:
-            source_label = this_result["label"]
-            hits = this_result["mappingResponseList"]
-            ontology_dict = {}
-            for hit in hits:
-                target_ontology = hit['targetPrefix']
-                """ Create one key per target ontology, then append individual hits to associated array """
-                ontology_dict.setdefault(
-                    target_ontology, []).append({'curie': hit['curie'], 'target_label': hit['label'], 'distance': hit['distance']})
-            # for okey in ontology_dict:
-                # ontology_dict[okey] = ', '.join(ontology_dict[okey])
-            iri_dict[this_result["queryId"]] = {'source_label': source_label, 'ontodict': ontology_dict}
-            # newsflash(ontology_dict)
+        if "_embedded" in json_string:
+            search_results.extend(json_string["_embedded"]["searchResults"])
+        elif json_string.get("page", {}).get("totalElements") != 0:
+            raise OxoQueryError("no search results in OxO reply, after %d calls, with %d query terms" %
+                                (oxo_hit_counter, len(batch_iris)))
         try:
             quantified_url = json_string["_links"]["next"]["href"]
         except KeyError:
-            newsflash("Stopped: all good!")
             quantified_url = None
-    newsflash("No. of iterative calls to OxO web API was %d" % len(json_strings))
+    return search_results, oxo_hit_counter, reply_bytes
+
+
+class BatchSizer(object):
+    """
+    Additive-increase, multiplicative-decrease control of the number of source IRIs per OxO request: the batch size
+    grows by a step while OxO replies quickly, and is halved after a slow or oversized reply, or a failed request
+    """
+
+    def __init__(self, initial_size, minimum_size=1, maximum_size=None):
+        self.size = initial_size
+        self.step = max(1, initial_size // 4)
+        self.minimum_size = minimum_size
+        self.maximum_size = maximum_size or initial_size * 8
+
+    def success(self, seconds, reply_bytes):
+        if seconds > OXO_FAST_SECONDS or reply_bytes > OXO_MAX_REPLY_BYTES:
+            self.size = max(self.minimum_size, self.size // 2)
+        else:
+            self.size = min(self.maximum_size, self.size + self.step)
+
+    def failure(self, refused_size=None):
+        """ A batch refused as too large (e.g. 413) also caps the batch size from then on """
+        if refused_size is not None:
+            self.maximum_size = max(self.minimum_size, min(self.maximum_size, refused_size - 1))
+        self.size = max(self.minimum_size, min(self.maximum_size, self.size // 2))
+
+
+def backoff_seconds(attempt):
+    """ Exponential backoff with full jitter, before retry number 'attempt' (from 1) """
+    return random.uniform(0, min(OXO_MAX_BACKOFF_SECONDS, OXO_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def absorb_results(iri_dict, search_results):
+    """
+    Convert OxO search results into IRI dictionary entries, keyed on target ontology, keeping OxO's order of hits (the
+    entries at any lesser distance may be derived by dropping hits further away, which leaves that order unchanged)
+    """
+    for this_result in search_results:
+        source_label = this_result["label"]
+        ontology_dict = {}
+        for hit in this_result["mappingResponseList"]:
+            target_ontology = hit['targetPrefix']
+            """ Create one key per target ontology, then append individual hits to associated array """
+            ontology_dict.setdefault(
+                target_ontology, []).append({'curie': hit['curie'], 'target_label': hit['label'], 'distance': hit['distance']})
+        iri_dict[this_result["queryId"]] = {'source_label': source_label, 'ontodict': ontology_dict}
+
+
+def map_iris(iri_dict, target_ontologies, distance, use_paxo, oxo_inner_url, query_size, verbose, cache_file=None,
+             cache_ttl=None, cache_size=None, oxo_threads=1, journal=None, session=None):
+    """
+    Fill in the IRI dictionary with the OxO mappings of its source IRIs; a long-lived caller may pass in its own
+    requests session, to keep its connections to OxO open between calls
+    :return set of source IRIs that could not be mapped, as OxO kept failing on them:
+    """
+    query_iris = list(iri_dict.keys())
+    if cache_file is not None:
+        """ Only send IRIs to OxO that are not already in the persistent mapping cache """
+        cache = oxocache.open_cache(cache_file)
+        cached = oxocache.fetch_cached(cache, query_iris, target_ontologies, distance, cache_ttl)
+        iri_dict.update(cached)
+        query_iris = [iri for iri in query_iris if iri not in cached]
+        newsflash("OxO mapping cache: %d hits, %d misses" % (len(cached), len(query_iris)))
+        ontometrics.count('cache_hits', len(cached))
+        ontometrics.count('cache_misses', len(query_iris))
+    network_iris = query_iris
+    if journal is not None:
+        """ IRIs answered before a previous run died are taken from its journal, rather than re-queried """
+        journal_results, network_iris = ontojournal.journalled_results(journal, query_iris, distance)
+        absorb_results(iri_dict, journal_results)
+        newsflash("Journal: %d source IRIs already mapped, %d to query" %
+                  (len(query_iris) - len(network_iris), len(network_iris)))
+        ontometrics.count('journal_hits', len(query_iris) - len(network_iris))
+
+    """
+    Query terms are sent concurrently, over a pooled, keep-alive session, in batches starting at --number IRIs, whose
+    size then adapts to OxO's response; a failed batch is split in two, and both halves re-queued after a backoff, so
+    that only IRIs that fail on their own, OXO_MAX_RETRIES times over, are left unmapped
+    """
+    sizer = BatchSizer(query_size)
+    """ Runs of IRIs still to query: (position in network_iris, IRIs, attempt number, time not to retry before) """
+    pending = collections.deque([(0, network_iris, 0, 0.0)] if network_iris else [])
+    batch_results = {}
+    failed_iris = []
+    tally = {'calls': 0, 'batches': 0, 'retries': 0, 'in_flight': 0, 'fatal': None}
+    condition = threading.Condition()
+    oxo_threads = max(1, min(oxo_threads, -(-len(network_iris) // query_size)))
+    own_session = session is None
+    if own_session:
+        session = oxo_session(oxo_threads)
+
+    def next_batch():
+        """ Take the next batch, of the current size, from the first pending run of IRIs due to be (re)tried """
+        with condition:
+            while True:
+                if tally['fatal'] is not None or (not pending and tally['in_flight'] == 0):
+                    return None
+                now = time.time()
+                due = [r for r, run in enumerate(pending) if run[3] <= now]
+                if due:
+                    position, run_iris, attempt, not_before = pending[due[0]]
+                    batch_size = sizer.size
+                    if len(run_iris) > batch_size:
+                        pending[due[0]] = (position + batch_size, run_iris[batch_size:], attempt, not_before)
+                    else:
+                        del pending[due[0]]
+                    tally['in_flight'] += 1
+                    return position, run_iris[:batch_size], attempt
+                condition.wait(min([run[3] for run in pending]) - now if pending else None)
+
+    def query_batches():
+        try:
+            query_batch_loop()
+        except Exception as fatal_error:
+            with condition:
+                tally['fatal'] = fatal_error
+                condition.notify_all()
+
+    def query_batch_loop():
+        while True:
+            batch = next_batch()
+            if batch is None:
+                return
+            position, batch_iris, attempt = batch
+            t0 = time.time()
+            try:
+                search_results, batch_calls, reply_bytes = query_oxo(session, oxo_inner_url, batch_iris,
+                                                                     target_ontologies, distance, len(batch_iris),
+                                                                     verbose)
+                error = None
+            except (requests.exceptions.RequestException, ValueError, OxoQueryError) as oxo_error:
+                error = oxo_error
+            if error is None and journal is not None:
+                ontojournal.record_batch(journal, batch_iris, search_results, distance)
+            with condition:
+                tally['in_flight'] -= 1
+                if error is None:
+                    sizer.success(time.time() - t0, reply_bytes)
+                    batch_results[position] = search_results
+                    tally['calls'] += batch_calls
+                    tally['batches'] += 1
+                elif attempt + 1 > OXO_MAX_RETRIES and len(batch_iris) == 1:
+                    newsflash("Giving up on %s after %d attempts: %s" % (batch_iris[0], attempt + 1, error))
+                    failed_iris.extend(batch_iris)
+                else:
+                    refused = isinstance(error, requests.exceptions.HTTPError) and error.response is not None and \
+                        error.response.status_code in {413, 414}
+                    sizer.failure(len(batch_iris) if refused else None)
+                    tally['retries'] += 1
+                    newsflash("OxO request of %d IRIs failed (%s): retrying, in smaller batches of %d ..." %
+                              (len(batch_iris), error, sizer.size))
+                    not_before = time.time() + backoff_seconds(attempt + 1)
+                    half = (len(batch_iris) + 1) // 2
+                    for split_position, split_iris in [(position, batch_iris[:half]),
+                                                       (position + half, batch_iris[half:])]:
+                        if split_iris:
+                            pending.appendleft((split_position, split_iris, attempt + 1, not_before))
+                condition.notify_all()
+
+    workers = [threading.Thread(target=query_batches) for t in range(oxo_threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if own_session:
+        session.close()
+    if tally['fatal'] is not None:
+        raise tally['fatal']
+    """ Merge in query order, so that the IRI dictionary is filled deterministically """
+    for position in sorted(batch_results):
+        absorb_results(iri_dict, batch_results[position])
+    ontometrics.count('oxo_retries', tally['retries'])
+    ontometrics.count('oxo_failed_iris', len(failed_iris))
+    failed_iris = set(failed_iris)
+    if failed_iris:
+        newsflash("Stopped: %d source IRIs could not be mapped, and are left out" % len(failed_iris))
+        query_iris = [iri for iri in query_iris if iri not in failed_iris]
+    else:
+        newsflash("Stopped: all good!")
+    newsflash("No. of calls to OxO web API was %d, for %d batches (%d retried) on %d threads; final batch size %d" %
+              (tally['calls'], tally['batches'], tally['retries'], oxo_threads, sizer.size))
+    if cache_file is not None:
+        oxocache.store_cached(cache, {iri: iri_dict[iri] for iri in query_iris}, target_ontologies, distance)
+        evicted = oxocache.evict_cached(cache, cache_ttl, cache_size)
+        newsflash("OxO mapping cache: %d new IRIs stored, %d expired or surplus entries evicted" %
+                  (len(query_iris), evicted))
+        cache.close()
     """ Passed-in dictionary object is mutated in situ: no need to return it """
-    return None
+    return failed_iris
+
+
+def oxo_session(pool_size):
+    """ Pooled, keep-alive HTTP session for OxO requests, with up to pool_size connections kept open """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
-def augment(panda_input, iri_map, table_layout, colno, keep_original, iri_format):
+""" IRI namespaces of target ontologies whose terms are not OBO PURLs (http://purl.obolibrary.org/obo/PREFIX_ID) """
+DEFAULT_PREFIXES = {'EFO': 'http://www.ebi.ac.uk/efo/EFO_', 'MeSH': 'http://id.nlm.nih.gov/mesh/',
+                    'Orphanet': 'http://www.orpha.net/ORDO/Orphanet_', 'OMIM': 'https://omim.org/entry/',
+                    'UMLS': 'http://linkedlifedata.com/resource/umls/id/', 'SNOMEDCT': 'http://snomed.info/id/',
+                    'ICD9': 'http://purl.bioontology.org/ontology/ICD9CM/',
+                    'ICD10': 'http://purl.bioontology.org/ontology/ICD10/'}
+OBO_NAMESPACE = 'http://purl.obolibrary.org/obo/%s_'
+
+
+class IriFormatter(object):
+    """
+    Converts target term CURIEs, as OxO returns them, to the requested format: 'curie' (unchanged), 'short' (PREFIX_ID,
+    as OLS short forms) or 'long' (full IRIs), from a table of IRI namespaces keyed on prefix (case-insensitive), which
+    the [Prefixes] section of the config may add to or override. Each distinct CURIE is converted only once.
+    """
+
+    def __init__(self, iri_format, prefixes=None):
+        self.iri_format = iri_format or 'curie'
+        self.namespaces = {prefix.lower(): namespace for prefix, namespace in DEFAULT_PREFIXES.items()}
+        self.namespaces.update({prefix.lower(): namespace for prefix, namespace in (prefixes or {}).items()})
+        self.formatted = {}
+
+    def __call__(self, curie):
+        if self.iri_format == 'curie':
+            return curie
+        try:
+            return self.formatted[curie]
+        except KeyError:
+            prefix, colon, local_id = curie.partition(':')
+            if not colon:
+                formatted = curie
+            elif self.iri_format == 'short':
+                formatted = '%s_%s' % (prefix, local_id)
+            else:
+                formatted = self.namespaces.get(prefix.lower(), OBO_NAMESPACE % prefix) + local_id
+            self.formatted[curie] = formatted
+            return formatted
+
+
+def iri_formatter(iri_format):
+    """ The augment engines take either a format name, or an IriFormatter with its own prefix table """
+    return iri_format if isinstance(iri_format, IriFormatter) else IriFormatter(iri_format)
+
+
+def augment(panda_input, iri_map, table_layout, colno, keep_original, iri_format, column_prefix=''):
     colname = panda_input.columns[colno]
-    prev_colname = panda_input.columns[colno - 1]
-    next_colname = panda_input.columns[colno + 1]
     out_columns = panda_input.columns
     newsflash()
     newsflash('These are the column headers of your pandas DataFrame:')
@@ -178,78 +480,59 @@ def augment(panda_input, iri_map, table_layout, colno, keep_original, iri_format
     tt0 = time.time()
     tt1 = tt0
     newsflash('Processing input records ...')
-    for in_tuple in panda_input.itertuples():
+    format_target = iri_formatter(iri_format)
+    cell_cache = {}
+    category_cells = None
+    if panda_input.iloc[:, colno].dtype.name == 'category':
+        """ A categorical source column (--low-memory) has each category worked out once, and looked up by its code """
+        category_cells = [render_cell(category, iri_map, table_layout, keep_original, format_target)
+                          for category in panda_input.iloc[:, colno].cat.categories]
+        category_codes = panda_input.iloc[:, colno].cat.codes.to_numpy()
+    for row_number, in_tuple in enumerate(panda_input.itertuples()):
         """ Need to convert back to regular tuple, from pandafied named tuple with extra leading index number """
         in_supple = tuple(in_tuple[1:])
         # source_string = in_tuple[colname]
         source_string = in_supple[colno]
-        source_terms = list(map(lambda x: x.strip(), source_string.split(",")))
-        target_groups = {}
-        if table_layout == 'in-situ' and keep_original:
-            """ Key '00source00' is lazy, collational way of placing source terms at top of list, where we want them """
-            target_groups.setdefault('00source00', source_terms )
-        for source_term in source_terms:
-            # newsflash("Source term is %s" % source_term)
-            # map_dict = iri_map[source_term]
-            map_dict = iri_map.get(source_term)
-            # print('map_dict below ...', file=sys.stderr)
-            # print(map_dict, file=sys.stderr)
-            if map_dict:
-                for m in map_dict['ontodict']:
-                    # print(m, file=sys.stderr)
-                    """ target_groups assigned one key per target ontology --- NOT per source term in source cell! """
-                    # target_groups.setdefault(m, []).append(map_dict['ontodict'][m])
-                    ncount = 0;
-                    for n in map_dict['ontodict'][m]:
-                        target_groups.setdefault(m, []).append(map_dict['ontodict'][m][ncount]['curie'])
-                        ncount += 1
-
-        for target_group in target_groups:
-            # newsflash("Data type of target_groups: %s" % type(target_groups))
-            # newsflash("Data type of target_group: %s" % type(target_group))
-            # newsflash("target_group: %s" % target_group)
-            # newsflash("Data type of target_groups[target_group]: %s" % type(target_groups[target_group]))
-            # print(target_groups[target_group], file=sys.stderr)
-            target_groups[target_group] = ', '.join(target_groups[target_group])
-        tg_series = pd.Series(target_groups)
-        # tg_series = tg_series.reindex(sorted(tg_series.index))
-        # newsflash(tg_series)
+        if category_cells is not None and category_codes[row_number] >= 0:
+            target_groups, target_string = category_cells[category_codes[row_number]]
+        else:
+            """ Rows sharing a source cell share its target groups and string, so each cell is only worked out once """
+            if source_string not in cell_cache:
+                cell_cache[source_string] = render_cell(source_string, iri_map, table_layout, keep_original,
+                                                        format_target)
+            target_groups, target_string = cell_cache[source_string]
+        tg_values = list(target_groups.values())
 
         # out_dict_list = []
 
-        if table_layout in {'in-situ', 'uni-row', 'uni-column'}:
-            target_string = ', '.join(tg_series.values)
-            # newsflash("Additions to %s from MeSH: %s" % (source_string, target_string))
-            # newsflash()
-
         if table_layout in {'in-situ', 'uni-row', 'multi-row'}:
             out_dict = dict(zip(out_columns, in_supple))
             # newsflash(out_dict)
 
             if table_layout == 'in-situ' or keep_original:
-                if len(tg_series) > 0 or keep_original:
+                if len(tg_values) > 0 or keep_original:
                     if table_layout == 'in-situ':
                         out_dict[colname] = target_string
                     out_dict_list.append(out_dict)
 
-            if table_layout == 'uni-row' and len(tg_series) > 0:
+            if table_layout == 'uni-row' and len(tg_values) > 0:
                 out_dict_extra = dict(out_dict)
                 out_dict_extra[colname] = target_string
                 out_dict_list.append(out_dict_extra)
 
             elif table_layout == 'multi-row':
-                for hit in tg_series.values:
+                for hit in tg_values:
                     out_dict_iter = dict(out_dict)
                     out_dict_iter[colname] = hit
                     out_dict_list.append(out_dict_iter)
 
-        elif table_layout in {'uni-column', 'multi-column'} and (len(tg_series) > 0 or keep_original):
+        elif table_layout in {'uni-column', 'multi-column'} and (len(tg_values) > 0 or keep_original):
             """ Now need to handle uni- and multi-column outputs """
             out_dict = dict(zip(out_columns, in_supple))
             out_dict_list.append(out_dict)
             extra_col_dict = {}
             if table_layout == 'multi-column':
-                extra_col_dict = dict(tg_series)
+                extra_col_dict = dict(target_groups)
             elif table_layout == 'uni-column':
                 # extra_col_dict = dict({'all_ontologies', ', '.join(tg_series.values)})
                 extra_col_dict = dict({'EQUIVALENT_TRAIT_URIS': target_string})
@@ -273,26 +556,1055 @@ def augment(panda_input, iri_map, table_layout, colno, keep_original, iri_format
         # extra_columns_df = pd.DataFrame(extra_col_dict_list,
         #                                 columns=[colname] if table_layout == 'uni-column' else tg_series.keys())
         extra_columns_df = pd.DataFrame(extra_col_dict_list)
-        panda_output = pd.concat([
-            None if colno == 0 and not keep_original else
-            panda_output.loc[:, :colname if keep_original else prev_colname], extra_columns_df,
-            None if colno == len(panda_input.columns) - 1 else panda_output.loc[:, next_colname:]], axis=1)
+        panda_output = splice_columns(panda_output, extra_columns_df, colno, keep_original, column_prefix)
 
     return panda_output
 
 
-def re_ontologise(input_file, output, layout, file_format, column_index, column_name, keep, target, uri_format,
-                  distance, paxo, oxo_url, number, verbose, mapping_file):
+def render_cell(source_string, iri_map, table_layout, keep_original, format_target):
+    """
+    Work out the target terms for one source cell, as augment needs them
+    :return dictionary of joined target terms, keyed on target ontology, and all of them joined into a single string:
+    """
+    source_terms = list(map(lambda x: x.strip(), source_string.split(",")))
+    target_groups = {}
+    if table_layout == 'in-situ' and keep_original:
+        """ Key '00source00' is lazy, collational way of placing source terms at top of list, where we want them """
+        target_groups.setdefault('00source00', source_terms)
+    for source_term in source_terms:
+        map_dict = iri_map.get(source_term)
+        if map_dict:
+            for m in map_dict['ontodict']:
+                """ target_groups assigned one key per target ontology --- NOT per source term in source cell! """
+                for n in map_dict['ontodict'][m]:
+                    target_groups.setdefault(m, []).append(format_target(n['curie']))
+    for target_group in target_groups:
+        target_groups[target_group] = ', '.join(target_groups[target_group])
+    return target_groups, ', '.join(target_groups.values())
+
+
+def splice_columns(panda_output, extra_columns_df, colno, keep_original, column_prefix=''):
+    """
+    Insert new ontology column(s) after the source column, or in place of it if not keeping source terms; their
+    names are prefixed with column_prefix, if given, to tell apart the new columns of different source columns
+    """
+    colname = panda_output.columns[colno]
+    if column_prefix:
+        extra_columns_df = extra_columns_df.rename(columns=lambda c: column_prefix + c)
+    last_colno = len(panda_output.columns) - 1
+    return pd.concat([
+        None if colno == 0 and not keep_original else
+        panda_output.loc[:, :colname if keep_original else panda_output.columns[colno - 1]], extra_columns_df,
+        None if colno == last_colno else panda_output.loc[:, panda_output.columns[colno + 1]:]], axis=1)
+
+
+def augment_columns(panda_input, iri_map, column_dicts, table_layouts, keep_original, iri_format, augment_engine):
+    """
+    Augment each source column in turn, with its own layout: when there are several source columns, the names of the
+    new columns are prefixed with those of their source columns (e.g. 'MAPPED_TRAIT_URI_mesh'), so as not to clash
+    """
+    panda_output = panda_input
+    for column_dict, table_layout in zip(column_dicts, table_layouts):
+        colno = panda_output.columns.get_loc(column_dict['name'])
+        column_prefix = column_dict['name'] + '_' if len(column_dicts) > 1 else ''
+        panda_output = augment_engine(panda_output, iri_map, table_layout, colno, keep_original, iri_format,
+                                      column_prefix)
+    return panda_output
+
+
+def augment_columnar(panda_input, iri_map, table_layout, colno, keep_original, iri_format, column_prefix=''):
+    """
+    Columnar equivalent of augment, producing identical output: rather than walking the spreadsheet row by row, the
+    source column is factorised into unique cells, which are exploded into source terms and merged with a table of
+    mappings derived from iri_map; the resulting target strings are then broadcast back onto the rows
+    """
+    colname = panda_input.columns[colno]
+    tt0 = time.time()
+    newsflash('Processing input records (columnar engine) ...')
+    cell_codes, cells = pd.factorize(panda_input.iloc[:, colno])
+    cell_count = len(cells)
+
+    """ One row per source term occurrence, indexed on cell code, with its position in the cell """
+    source_terms = pd.Series(list(cells), dtype=object).str.split(',').explode().str.strip()
+    term_df = pd.DataFrame({'cell': source_terms.index.values, 'term': source_terms.values})
+    term_df['term_pos'] = term_df.groupby('cell').cumcount()
+
+    """ One row per (source IRI, target ontology), in the order OxO listed them, with the hits pre-joined """
+    format_target = iri_formatter(iri_format)
+    map_df = pd.DataFrame([(iri, rank, ontology, ', '.join(format_target(hit['curie']) for hit in hits))
+                           for iri, map_dict in iri_map.items() if map_dict
+                           for rank, (ontology, hits) in enumerate(map_dict['ontodict'].items()) if hits],
+                          columns=['term', 'rank', 'ontology', 'curies'])
+    hit_df = term_df.merge(map_df, on='term', how='inner').sort_values(['cell', 'term_pos', 'rank'], kind='mergesort')
+    """ Target ontologies grouped per cell, in order of first appearance, as target_groups in augment """
+    group_df = hit_df.groupby(['cell', 'ontology'], sort=False)['curies'].agg(', '.join).reset_index()
+
+    cell_targets = np.full(cell_count, '', dtype=object)
+    joined_targets = group_df.groupby('cell', sort=False)['curies'].agg(', '.join)
+    cell_targets[joined_targets.index.values] = joined_targets.values
+    cell_has_hits = np.zeros(cell_count, dtype=bool)
+    cell_has_hits[joined_targets.index.values] = True
+    if table_layout == 'in-situ' and keep_original:
+        cell_sources = term_df.groupby('cell')['term'].agg(', '.join).values
+        cell_targets = np.where(cell_has_hits, cell_sources + ', ' + cell_targets, cell_sources).astype(object)
+        cell_has_hits[:] = True
+    row_has_hits = cell_has_hits[cell_codes]
+
+    if table_layout in {'in-situ', 'uni-column', 'multi-column'}:
+        selected = np.arange(len(panda_input)) if keep_original else np.flatnonzero(row_has_hits)
+        panda_output = panda_input.take(selected).reset_index(drop=True)
+        if table_layout == 'in-situ':
+            panda_output[colname] = cell_targets[cell_codes[selected]]
+        else:
+            newsflash("Adding new columns ...")
+            if len(selected) == 0:
+                extra_columns_df = pd.DataFrame()
+            elif table_layout == 'uni-column':
+                extra_columns_df = pd.DataFrame({'EQUIVALENT_TRAIT_URIS': cell_targets[cell_codes[selected]]})
+            else:
+                wide_df = group_df.pivot(index='cell', columns='ontology', values='curies')
+                wide_df = wide_df.reindex(index=range(cell_count), columns=pd.unique(group_df['ontology']))
+                extra_columns_df = wide_df.take(cell_codes[selected]).reset_index(drop=True)
+                extra_columns_df.columns = list(extra_columns_df.columns)
+            panda_output = splice_columns(panda_output, extra_columns_df, colno, keep_original, column_prefix)
+    else:
+        """ Row layouts: interleave original rows (sub-position 0) with their new rows (sub-position 1 onwards) """
+        if table_layout == 'uni-row':
+            extra_rows = np.flatnonzero(row_has_hits)
+            extra_subs = np.ones(len(extra_rows), dtype=int)
+            extra_values = cell_targets[cell_codes[extra_rows]]
+        else:
+            group_df['sub'] = group_df.groupby('cell').cumcount() + 1
+            row_df = pd.DataFrame({'row': np.arange(len(panda_input)), 'cell': cell_codes})
+            row_df = row_df.merge(group_df, on='cell', how='inner')
+            extra_rows = row_df['row'].values
+            extra_subs = row_df['sub'].values
+            extra_values = row_df['curies'].values
+        kept_rows = np.arange(len(panda_input)) if keep_original else np.arange(0)
+        out_rows = np.concatenate([kept_rows, extra_rows]).astype(int)
+        out_subs = np.concatenate([np.zeros(len(kept_rows), dtype=int), extra_subs])
+        out_values = np.concatenate([panda_input.iloc[kept_rows, colno].values.astype(object), extra_values])
+        out_order = np.lexsort((out_subs, out_rows))
+        panda_output = panda_input.take(out_rows[out_order]).reset_index(drop=True)
+        panda_output[colname] = out_values[out_order]
+
+    tt1 = time.time()
+    newsflash("Processed a total of %d input records, in %.2f seconds" % (len(panda_input), float(tt1 - tt0)))
+    newsflash("No. of records in output spreadsheet is %d" % len(panda_output))
+    newsflash()
+    return panda_output
+
+
+def resolve_columns(header, column_dicts):
+    """ Fill in the index of each source column given by name, and the name of each given by index """
+    for column_dict in column_dicts:
+        if column_dict['index'] is None:
+            column_dict['index'] = header.index(column_dict['name'])
+        else:
+            column_dict['name'] = header[column_dict['index']]
+
+
+def open_spreadsheet(spreadsheet, download_dir=None):
+    """ Return a local filepath for the spreadsheet, streaming it from its URL to a local (cache) file if need be """
+    if remote_spreadsheet(spreadsheet):
+        return fetch_spreadsheet(spreadsheet, download_dir)
+    return spreadsheet
+
+
+def remote_spreadsheet(spreadsheet):
+    url_bool = re.compile('[a-zA-Z](\w|[-+.])*://.*')
+    return url_bool.match(spreadsheet) is not None
+
+
+def categorise_columns(panda_df, max_unique_ratio=0.5):
+    """
+    Hold text columns with few enough distinct values (relative to the number of rows) as categoricals, and any other
+    text columns as plain strings
+    """
+    panda_columns = []
+    for c in range(panda_df.shape[1]):
+        panda_column = panda_df.iloc[:, c]
+        if panda_column.dtype == object or panda_column.dtype.name == 'category':
+            repetitive = panda_column.nunique() <= max_unique_ratio * len(panda_column)
+            panda_column = panda_column.astype('category' if repetitive else object)
+        panda_columns.append(panda_column)
+    if not panda_columns:
+        return panda_df
+    categorised_df = pd.concat(panda_columns, axis=1, keys=range(len(panda_columns)))
+    categorised_df.columns = panda_df.columns
+    return categorised_df
+
+
+def read_categorised(source, separator, usecols, chunk_size=100000):
+    """
+    Low-memory equivalent of read_columns for text spreadsheets: the spreadsheet is read in chunks, text columns being
+    converted to categoricals as it goes, so that it is never held in full as Python strings. Any column whose type is
+    inferred differently from one chunk to another is re-read on its own, so that all types match a single read
+    """
+    chunk_columns = None
+    for panda_chunk in pd.read_csv(source, sep=separator, low_memory=False, keep_default_na=False, usecols=usecols,
+                                   chunksize=chunk_size):
+        if chunk_columns is None:
+            column_names = panda_chunk.columns
+            chunk_columns = [[] for c in column_names]
+        for c in range(panda_chunk.shape[1]):
+            chunk_column = panda_chunk.iloc[:, c]
+            chunk_columns[c].append(chunk_column.astype('category') if chunk_column.dtype == object else chunk_column)
+    if chunk_columns is None:
+        return read_columns(source, None, separator, usecols)
+    panda_columns = []
+    for c, column_pieces in enumerate(chunk_columns):
+        if len({piece.dtype.name for piece in column_pieces}) > 1:
+            panda_columns.append(read_columns(source, None, separator, [usecols[c]]).iloc[:, 0])
+        elif column_pieces[0].dtype.name == 'category':
+            panda_columns.append(pd.Series(pd.api.types.union_categoricals([piece.values for piece in column_pieces])))
+        else:
+            panda_columns.append(pd.concat(column_pieces, ignore_index=True))
+    panda_df = pd.concat(panda_columns, axis=1, keys=range(len(panda_columns)))
+    panda_df.columns = column_names
+    return categorise_columns(panda_df)
+
+
+def open_arrow(source):
+    pa = ontowriter.import_optional('pyarrow', 'Arrow input')
+    return pa.ipc.open_file(pa.memory_map(source))
+
+
+def arrow_frame(arrow_data, usecols):
+    """ Convert the given column positions (all, if None) of an Arrow table or record batch to a DataFrame """
+    if usecols is not None:
+        pa = ontowriter.import_optional('pyarrow', 'Arrow input')
+        arrow_data = pa.Table.from_arrays([arrow_data.column(c) for c in usecols],
+                                          names=[arrow_data.schema.names[c] for c in usecols])
+    return arrow_data.to_pandas()
+
+
+def read_header(source, input_format, separator):
+    """ Column names of a spreadsheet, read without loading any rows """
+    if input_format == 'parquet':
+        parquet = ontowriter.import_optional('pyarrow.parquet', 'Parquet input')
+        return list(parquet.ParquetFile(source).schema_arrow.names)
+    if input_format == 'arrow':
+        return list(open_arrow(source).schema.names)
+    return list(pd.read_csv(source, sep=separator, nrows=0).columns)
+
+
+def read_columns(source, input_format, separator, usecols=None):
+    """ Read the given column positions (all, if None) of a csv, tsv, Parquet or Arrow spreadsheet """
+    if input_format == 'parquet':
+        parquet = ontowriter.import_optional('pyarrow.parquet', 'Parquet input')
+        names = None if usecols is None else [read_header(source, input_format, separator)[c] for c in usecols]
+        return parquet.read_table(source, columns=names, memory_map=True).to_pandas()
+    if input_format == 'arrow':
+        return arrow_frame(open_arrow(source).read_all(), usecols)
+    return pd.read_csv(source, sep=separator, low_memory=False, keep_default_na=False, usecols=usecols)
+
+
+def read_chunks(source, input_format, separator, chunk_size, usecols=None, **csv_args):
+    """ Iterate over a spreadsheet in DataFrame chunks of at most chunk_size rows; csv_args go to pd.read_csv """
+    if input_format == 'parquet':
+        parquet = ontowriter.import_optional('pyarrow.parquet', 'Parquet input')
+        parquet_file = parquet.ParquetFile(source, memory_map=True)
+        names = None if usecols is None else [parquet_file.schema_arrow.names[c] for c in usecols]
+        for record_batch in parquet_file.iter_batches(batch_size=chunk_size, columns=names):
+            yield record_batch.to_pandas()
+    elif input_format == 'arrow':
+        arrow_reader = open_arrow(source)
+        for b in range(arrow_reader.num_record_batches):
+            record_batch = arrow_reader.get_batch(b)
+            for offset in range(0, record_batch.num_rows, chunk_size):
+                yield arrow_frame(record_batch.slice(offset, chunk_size), usecols)
+    else:
+        for panda_chunk in pd.read_csv(source, sep=separator, chunksize=chunk_size, usecols=usecols, **csv_args):
+            yield panda_chunk
+
+
+def collect_iris(spreadsheet, separator, column_dict, download_dir=None, input_format=None):
+    """
+    Lightweight alternative to parse_ss, for mapping-only runs: the source term column(s) of a text spreadsheet are
+    streamed with the csv module (pandas is not needed), and each distinct cell split into source IRIs just once
+    :return IRI dictionary, with keys in order of first appearance, as parse_ss['unique_iris']:
+    """
+    column_dicts = column_dict if isinstance(column_dict, list) else [column_dict]
+    filestuff = open_spreadsheet(spreadsheet, download_dir)
+    with ontometrics.span('extract_iris'):
+        if input_format in {'parquet', 'arrow'}:
+            header = read_header(filestuff, input_format, separator)
+        else:
+            csv.field_size_limit(2 ** 31 - 1)
+            source = gzip.open(filestuff, 'rt', newline='', encoding='utf-8') if filestuff.endswith('.gz') else \
+                open(filestuff, newline='', encoding='utf-8')
+            source_reader = csv.reader(source, delimiter=separator)
+            header = next(source_reader)
+        resolve_columns(header, column_dicts)
+        colnos = list(dict.fromkeys(column['index'] for column in column_dicts))
+        """ IRIs are gathered per column, then pooled column by column, in the same order as parse_ss """
+        column_iris = {colno: {} for colno in colnos}
+        seen_cells = {colno: set() for colno in colnos}
+        if input_format in {'parquet', 'arrow'}:
+            source_df = read_columns(filestuff, input_format, separator, sorted(colnos)).fillna('')
+            source_records = zip(*[source_df[header[colno]] for colno in colnos])
+        else:
+            source_records = ([record[colno] if colno < len(record) else '' for colno in colnos]
+                              for record in source_reader if record)
+        row_count = 0
+        for source_record in source_records:
+            row_count += 1
+            for colno, source_cell in zip(colnos, source_record):
+                if source_cell not in seen_cells[colno]:
+                    seen_cells[colno].add(source_cell)
+                    column_iris[colno].update(dict.fromkeys(split_terms(source_cell)))
+        if input_format not in {'parquet', 'arrow'}:
+            source.close()
+    iri_map = {}
+    for colno in colnos:
+        iri_map.update(column_iris[colno])
+    ontometrics.count('rows_in', row_count)
+    if filestuff != spreadsheet and download_dir is None:
+        os.remove(filestuff)
+    newsflash("Collected %d unique source IRIs from %d records" % (len(iri_map), row_count))
+    return iri_map
+
+
+def split_terms(source_cell):
+    """ Split a source cell into its (stripped) source terms, as parse_ss does """
+    return [] if source_cell == '' else list(map(lambda w: w.strip(), source_cell.split(",")))
+
+
+""" Chunks read ahead while their source IRIs are being mapped, when pipelining; and the default size of a chunk """
+PIPELINE_DEPTH = 8
+PIPELINE_CHUNK_SIZE = 50000
+
+
+def stream_ontologise(input_file, separator, column_dict, table_layout, keep_original, iri_format, chunk_size,
+                      augment_engine, map_new_iris, writer, download_dir=None, input_format=None, pipeline=False):
+    """
+    Bounded-memory alternative to parse_ss, map_iris and augment: the spreadsheet is read, mapped, augmented and
+    written out chunk by chunk, so that only the unique IRI dictionary grows with the size of the input. As in
+    augment_columns, column_dict and table_layout may be lists, one entry per source column; writer may be a
+    dictionary of writers keyed on OxO distance, as from distance_outputs, each chunk being written to all of them.
+    If pipelining, the new source IRIs of each chunk are mapped in a background thread, while the following chunks are
+    read and parsed (a remote text spreadsheet being parsed as it downloads), each chunk being augmented as soon as all
+    its source IRIs are mapped, so that waiting on OxO overlaps with the rest of the work; the output is unchanged
+    :return IRI dictionary, as filled in by map_iris:
+    """
+    iri_map = {}
+    queued_iris = {}
+    column_dicts = column_dict if isinstance(column_dict, list) else [column_dict]
+    table_layouts = table_layout if isinstance(table_layout, list) else [table_layout] * len(column_dicts)
+    writers = writer if isinstance(writer, dict) else {None: writer}
+    """ Mappings as at each output distance, derived from iri_map as new source IRIs are mapped """
+    distance_maps = {d: {} for d in writers}
+    download = None
+    if pipeline and remote_spreadsheet(input_file) and input_format in {'csv', 'tsv'} and \
+            not urllib.parse.urlparse(input_file).path.endswith('.gz'):
+        download, source = stream_spreadsheet(input_file, download_dir)
+    else:
+        source = open_spreadsheet(input_file, download_dir)
+    if download is None:
+        header = read_header(source, input_format, separator)
+    else:
+        """ The rest of the download is read under the header line, as it arrives """
+        header = list(pd.read_csv(io.BytesIO(download.readline()), sep=separator, nrows=0).columns)
+    resolve_columns(header, column_dicts)
+    colnos = [column['index'] for column in column_dicts]
+
+    def source_chunks(usecols=None, **csv_args):
+        """ Read the spreadsheet in chunks: from the download, while it is still in progress, else the local file """
+        nonlocal download
+        if download is None:
+            return read_chunks(source, input_format, separator, chunk_size, usecols, **csv_args)
+        download_chunks = read_chunks(download, input_format, separator, chunk_size, usecols, header=None,
+                                      names=header, **csv_args)
+        download = None
+        return download_chunks
+
+    def resolved_chunks(panda_chunks):
+        """
+        Map the new source IRIs of each chunk (at once, or in the background, if pipelining), yielding the chunks in
+        their original order, as soon as all their source IRIs are mapped
+        """
+        pending_chunks = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as mapper:
+            for panda_chunk in panda_chunks:
+                with ontometrics.span('extract_iris'):
+                    new_iris = {iri: None for colno in colnos for cell in pd.unique(panda_chunk[header[colno]])
+                                for iri in split_terms(cell) if iri not in queued_iris}
+                queued_iris.update(new_iris)
+                if new_iris and pipeline:
+                    pending_chunks.append((panda_chunk, new_iris, mapper.submit(map_new_iris, new_iris)))
+                else:
+                    if new_iris:
+                        map_new_iris(new_iris)
+                    pending_chunks.append((panda_chunk, new_iris, None))
+                while pending_chunks and (len(pending_chunks) > PIPELINE_DEPTH or pending_chunks[0][2] is None or
+                                          pending_chunks[0][2].done()):
+                    yield absorb_chunk_iris(*pending_chunks.popleft())
+            while pending_chunks:
+                yield absorb_chunk_iris(*pending_chunks.popleft())
+
+    def absorb_chunk_iris(panda_chunk, new_iris, mapping):
+        if mapping is not None:
+            mapping.result()
+        iri_map.update(new_iris)
+        for d in distance_maps:
+            distance_maps[d].update(new_iris if d is None else within_distance(new_iris, d))
+        return panda_chunk
+
+    """ New ontology columns, per multi-column source column: these have to be known before writing the header """
+    extra_columns = {d: {column['name']: {} for column, layout in zip(column_dicts, table_layouts)
+                         if layout == 'multi-column'} for d in writers}
+    if 'multi-column' in table_layouts:
+        newsflash("Pre-reading source term column(s), to determine new ontology columns ...")
+        for iri_chunk in resolved_chunks(iri_chunk.fillna('') for iri_chunk in
+                                         source_chunks(sorted(set(colnos)), keep_default_na=False, dtype=str)):
+            for d, distance_map in distance_maps.items():
+                ontology_columns(iri_chunk, header, column_dicts, keep_original, distance_map, extra_columns[d])
+    out_columns = {d: output_columns(header, column_dicts, table_layouts, keep_original, extra_columns[d])
+                   for d in writers}
+
+    def filled_chunks(panda_chunks):
+        for panda_chunk in panda_chunks:
+            ontometrics.count('rows_in', len(panda_chunk))
+            if input_format in {'parquet', 'arrow'}:
+                """ Columnar formats have nulls, rather than empty strings, for missing source terms """
+                for colno in set(colnos):
+                    panda_chunk.iloc[:, colno] = panda_chunk.iloc[:, colno].fillna('')
+            yield panda_chunk
+
+    """
+    Parquet and Arrow output have one schema, taken from the first chunk, which column types inferred from later chunks
+    of a text spreadsheet may not fit: so these are read as strings throughout
+    """
+    text_types = {'dtype': str} if input_format not in {'parquet', 'arrow'} and \
+        any(distance_writer.output_format in {'parquet', 'arrow'} for distance_writer in writers.values()) else {}
+    chunk_counter = 0
+    out_counter = 0
+    for panda_chunk in resolved_chunks(filled_chunks(source_chunks(low_memory=False, keep_default_na=False,
+                                                                   **text_types))):
+        for d, distance_writer in writers.items():
+            with ontometrics.span('augment', chunk=chunk_counter):
+                augmented_chunk = augment_columns(panda_chunk, distance_maps[d], column_dicts, table_layouts,
+                                                  keep_original, iri_format, augment_engine)
+                augmented_chunk = augmented_chunk.reindex(columns=out_columns[d])
+            with ontometrics.span('output', chunk=chunk_counter):
+                distance_writer.write(augmented_chunk)
+            out_counter += len(augmented_chunk)
+            ontometrics.count('rows_out', len(augmented_chunk))
+        chunk_counter += 1
+        newsflash("Streamed %d chunks: %d records out, %d unique IRIs so far" %
+                  (chunk_counter, out_counter, len(iri_map)))
+    if source != input_file and download_dir is None:
+        os.remove(source)
+    return iri_map
+
+
+def ontology_columns(source_chunk, header, column_dicts, keep_original, iri_map, extra_columns):
+    """
+    Add the target ontologies that augmenting a chunk of the spreadsheet would give new columns to extra_columns, a
+    dictionary of ontology dictionaries keyed on the names of multi-column source columns. Ontology columns appear in
+    the same order as they would have in a single DataFrame: without keeping source terms, this means only counting the
+    rows that augmenting the previous source columns would have kept
+    """
+    kept_rows = np.ones(len(source_chunk), dtype=bool)
+    for colno in [column['index'] for column in column_dicts]:
+        column_cells = source_chunk[header[colno]].fillna('')
+        for cell in pd.unique(column_cells[kept_rows]) if header[colno] in extra_columns else []:
+            for iri in split_terms(cell):
+                if iri_map.get(iri):
+                    extra_columns[header[colno]].update({ontology: None for ontology in iri_map[iri]['ontodict']})
+        if not keep_original:
+            kept_rows &= column_cells.map({
+                cell: any(iri_map.get(iri) and any(iri_map[iri]['ontodict'].values()) for iri in split_terms(cell))
+                for cell in pd.unique(column_cells)}).values.astype(bool)
+
+
+def output_columns(header, column_dicts, table_layouts, keep_original, extra_columns):
+    """ Columns of the augmented spreadsheet, given the new ontology columns of each multi-column source column """
+    out_columns = list(header)
+    for column, layout in zip(column_dicts, table_layouts):
+        colno = out_columns.index(column['name'])
+        column_prefix = column['name'] + '_' if len(column_dicts) > 1 else ''
+        if layout in {'uni-column', 'multi-column'}:
+            new_columns = ['EQUIVALENT_TRAIT_URIS'] if layout == 'uni-column' else list(extra_columns[column['name']])
+            out_columns = (out_columns[:colno + 1 if keep_original else colno] +
+                           [column_prefix + c for c in new_columns] + out_columns[colno + 1:])
+    return out_columns
+
+
+def text_shards(source, shard_count):
+    """
+    Split a text spreadsheet into up to shard_count byte ranges of roughly equal size, each starting at the beginning
+    of a line, so that each holds whole records. A line break may fall inside a quoted cell, so a spreadsheet with any
+    quote character in it is not split: its single shard is the whole file, header included
+    :return header line, as bytes, and list of (start, end) byte offsets:
+    """
+    with open(source, 'rb') as ss_input:
+        for block in iter(lambda: ss_input.read(1 << 24), b''):
+            if b'"' in block:
+                return b'', [(0, os.path.getsize(source))]
+        ss_input.seek(0)
+        header_bytes = ss_input.readline()
+        body_start = ss_input.tell()
+        body_size = os.path.getsize(source) - body_start
+        boundaries = [body_start]
+        for s in range(1, shard_count):
+            ss_input.seek(body_start + s * body_size // shard_count)
+            ss_input.readline()
+            boundaries.append(max(ss_input.tell(), boundaries[-1]))
+        boundaries.append(body_start + body_size)
+    byte_ranges = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+    return header_bytes, byte_ranges or [(body_start, body_start)]
+
+
+def read_shard(source, header_bytes, byte_range, separator, usecols=None, dtype=None):
+    """ Read one shard of a text spreadsheet, under the header line, as read_columns would read the whole of it """
+    with open(source, 'rb') as ss_input:
+        ss_input.seek(byte_range[0])
+        shard_bytes = ss_input.read(byte_range[1] - byte_range[0])
+    return pd.read_csv(io.BytesIO(header_bytes + shard_bytes), sep=separator, low_memory=False, keep_default_na=False,
+                       usecols=usecols, dtype=dtype)
+
+
+def shard_iris(source, header_bytes, byte_range, separator, colnos):
+    """ Worker process: collect the source IRIs of one shard, per source column, as parse_ss does """
+    usecols = sorted(set(colnos))
+    source_df = read_shard(source, header_bytes, byte_range, separator, usecols)
+    ontometrics.count('rows_in', len(source_df))
+    column_iris = {}
+    for colno in colnos:
+        unique_cells = np.asarray(pd.unique(source_df.iloc[:, usecols.index(colno)]), dtype=object)
+        column_iris[colno] = list(cell_iris(unique_cells))
+    return column_iris
+
+
+def shard_output(source, header_bytes, byte_range, separator, header, column_dicts, table_layouts, keep_original,
+                 iri_format, augment_engine, shard_map, distances, dtypes=None):
+    """
+    Worker process: read and augment one shard, against the mappings of its source IRIs, at each output distance (None
+    needing no filtering); dtypes, if given, override the column types pandas would infer from this shard alone
+    :return column types inferred, and dictionary keyed on distance of augmented DataFrame and new ontology columns:
+    """
+    panda_shard = read_shard(source, header_bytes, byte_range, separator, dtype=dtypes)
+    shard_outputs = {}
+    for d in distances:
+        distance_map = shard_map if d is None else within_distance(shard_map, d)
+        extra_columns = {column['name']: {} for column, layout in zip(column_dicts, table_layouts)
+                         if layout == 'multi-column'}
+        ontology_columns(panda_shard, header, column_dicts, keep_original, distance_map, extra_columns)
+        shard_outputs[d] = (augment_columns(panda_shard, distance_map, column_dicts, table_layouts, keep_original,
+                                            iri_format, augment_engine), extra_columns)
+    return {c: panda_shard[c].dtype for c in panda_shard.columns}, shard_outputs
+
+
+def reconcile_dtypes(shard_dtypes):
+    """
+    Column types that a single read of the whole spreadsheet would have inferred, for columns inferred differently from
+    one shard to another: floats, where every shard's type is numeric, else strings
+    """
+    reconciled = {}
+    for column in shard_dtypes[0]:
+        column_dtypes = [dtypes[column] for dtypes in shard_dtypes]
+        if any(dtype != column_dtypes[0] for dtype in column_dtypes):
+            numeric = all(dtype.kind in 'iuf' for dtype in column_dtypes)
+            reconciled[column] = 'float64' if numeric else str
+    return reconciled
+
+
+def shard_ontologise(input_file, separator, column_dict, table_layout, keep_original, iri_format, augment_engine,
+                     map_new_iris, writer, workers, download_dir=None):
+    """
+    Multi-core alternative to parse_ss and augment, for text spreadsheets: the spreadsheet is split into row-aligned
+    byte ranges, whose source IRIs are collected in a pool of worker processes, then mapped here, once; each shard is
+    then read and augmented in the pool against the (read-only) mappings of its own source IRIs, and the shards written
+    out in their original order. Columns whose types were inferred differently in different shards are re-read with
+    the types a single read would have given, and new ontology columns are put in single-DataFrame order, so that the
+    output is identical to that of parse_ss and augment. Column and writer arguments are as for stream_ontologise
+    :return IRI dictionary, as filled in by map_iris:
+    """
+    column_dicts = column_dict if isinstance(column_dict, list) else [column_dict]
+    table_layouts = table_layout if isinstance(table_layout, list) else [table_layout] * len(column_dicts)
+    writers = writer if isinstance(writer, dict) else {None: writer}
+    source = open_spreadsheet(input_file, download_dir)
+    header = read_header(source, None, separator)
+    resolve_columns(header, column_dicts)
+    colnos = list(dict.fromkeys(column['index'] for column in column_dicts))
+    header_bytes, byte_ranges = text_shards(source, workers)
+    if not header_bytes:
+        newsflash("%s has quoted cells, which may span lines: not splitting it into shards" % input_file)
+    newsflash("Split %s into %d shards, for %d worker processes" % (input_file, len(byte_ranges), workers))
+
+    with ontometrics.span('extract_iris', shards=len(byte_ranges)):
+        shard_column_iris = run_jobs(workers, shard_iris, [(source, header_bytes, byte_range, separator, colnos)
+                                                           for byte_range in byte_ranges])
+    """ Source IRIs in order of first appearance, column by column, as in parse_ss """
+    iri_map = {}
+    for colno in colnos:
+        for column_iris in shard_column_iris:
+            iri_map.update(dict.fromkeys(column_iris[colno]))
+    map_new_iris(iri_map)
+
+    shard_args = [(source, header_bytes, byte_range, separator, header, column_dicts, table_layouts, keep_original,
+                   iri_format, augment_engine,
+                   {iri: iri_map[iri] for iri in dict.fromkeys(iri for colno in colnos for iri in column_iris[colno])},
+                   list(writers))
+                  for byte_range, column_iris in zip(byte_ranges, shard_column_iris)]
+    with ontometrics.span('augment', shards=len(byte_ranges)):
+        shard_results = run_jobs(workers, shard_output, shard_args)
+        dtypes = reconcile_dtypes([shard_dtypes for shard_dtypes, shard_outputs in shard_results])
+        if dtypes:
+            newsflash("Column types differ between shards: re-reading %s" % ', '.join(map(str, dtypes)))
+            redo_shards = [s for s, (shard_dtypes, shard_outputs) in enumerate(shard_results)
+                           if any(shard_dtypes[c] != pd.api.types.pandas_dtype(dtypes[c]) for c in dtypes)]
+            for s, shard_result in zip(redo_shards, run_jobs(workers, shard_output,
+                                                             [shard_args[s] + (dtypes,) for s in redo_shards])):
+                shard_results[s] = shard_result
+
+    for d, distance_writer in writers.items():
+        extra_columns = {}
+        for shard_dtypes, shard_outputs in shard_results:
+            for column_name, ontologies in shard_outputs[d][1].items():
+                extra_columns.setdefault(column_name, {}).update(ontologies)
+        out_columns = output_columns(header, column_dicts, table_layouts, keep_original, extra_columns)
+        with ontometrics.span('output', shards=len(shard_results), distance=d):
+            for shard_dtypes, shard_outputs in shard_results:
+                distance_writer.write(shard_outputs[d][0].reindex(columns=out_columns))
+        ontometrics.count('rows_out', distance_writer.row_count)
+    if source != input_file and download_dir is None:
+        os.remove(source)
+    return iri_map
+
+
+def mapping_lines(efo_iri, map_dict, hitless=False):
+    """ Tab-separated lines of a source IRI and each of its target terms (if hitless, a line with none, if none) """
+    hit_lines = ["%s\t%s\t%s\t%s\t%d" % (efo_iri, map_dict['source_label'], efo_single['curie'],
+                                          efo_single['target_label'], efo_single['distance'])
+                 for efo_map in map_dict['ontodict'].values() for efo_single in efo_map] if map_dict else []
+    if hit_lines or not hitless:
+        return hit_lines
+    return ["%s\t%s\t\t\t" % (efo_iri, map_dict['source_label'] if map_dict else '')]
+
+
+def write_mapping_file(mapping_file, iri_map, mapping_records=None):
+    """
+    Print a tab-separated list of source and target terms. Given the mapping records of a delta run (as from
+    read_mapping_file), these are written instead, each line followed by the date the source term was mapped, and the
+    target ontologies and distance it was queried at, source terms without hits included; the file is written under a
+    temporary name and then moved into place, so that it may safely replace its predecessor
+    """
+    with open(mapping_file + '.part', 'w') as emf:
+        if mapping_records is None:
+            for efo_iri in iri_map.keys():
+                for mapping_line in mapping_lines(efo_iri, iri_map[efo_iri]):
+                    print(mapping_line, file=emf)
+        for efo_iri, iri_records in (mapping_records or {}).items():
+            for record in iri_records:
+                record_fields = "%s\t%s\t%s" % (record['date'], ' '.join(record['target'] or []),
+                                                 '' if record['distance'] is None else record['distance'])
+                for mapping_line in mapping_lines(efo_iri, record['map'], hitless=True):
+                    print("%s\t%s" % (mapping_line, record_fields), file=emf)
+    os.replace(mapping_file + '.part', mapping_file)
+
+
+def read_mapping_file(mapping_file):
+    """
+    Load a mapping file written by a previous run back into mapping records: per source IRI, one record for each OxO
+    query it was mapped by, holding its IRI dictionary entry (None if unknown to OxO), the date (YYYY-MM-DD), and the
+    target ontologies and distance of the query. Files without a date column are dated by their modification time;
+    those without the target and distance columns (e.g. from --mapping-file) leave them as None. A file that does not
+    exist yet (as on the first of a series of runs) holds no records
+    :return dictionary of lists of mapping records:
+    """
+    if not os.path.exists(mapping_file):
+        return {}
+    file_date = datetime.date.fromtimestamp(os.path.getmtime(mapping_file)).isoformat()
+    mapping_records = {}
+    with open(mapping_file) as pmf:
+        for mapping_line in pmf:
+            fields = mapping_line.rstrip('\n').split('\t')
+            if len(fields) < 5:
+                continue
+            efo_iri, source_label, curie, target_label, hit_distance = fields[:5]
+            mapped_date, mapped_target, mapped_distance = (fields[5:] + [file_date, '', ''][len(fields) - 5:])[:3]
+            iri_records = mapping_records.setdefault(efo_iri, [])
+            record = {'date': mapped_date, 'target': mapped_target.split() or None,
+                      'distance': int(mapped_distance) if mapped_distance else None,
+                      'map': {'source_label': source_label, 'ontodict': {}}}
+            if not iri_records or any(iri_records[-1][key] != record[key] for key in ['date', 'target', 'distance']):
+                iri_records.append(record)
+            if curie:
+                iri_records[-1]['map']['ontodict'].setdefault(curie.split(':')[0], []).append(
+                    {'curie': curie, 'target_label': target_label, 'distance': int(hit_distance)})
+    for iri_records in mapping_records.values():
+        for record in iri_records:
+            if not record['map']['source_label'] and not record['map']['ontodict']:
+                record['map'] = None
+    return mapping_records
+
+
+def previous_mapping(iri_records, target_ontologies, distance, oldest_date):
+    """
+    Find the latest mapping record, no older than oldest_date, of a query to (at least) the given target ontologies, at
+    (at least) the given distance, or from a file that does not record them
+    :return IRI dictionary entry, with just the hits in those target ontologies, within that distance; or False:
+    """
+    targets = {t.lower() for t in target_ontologies}
+    for record in sorted(iri_records, key=lambda r: r['date'], reverse=True):
+        if record['date'] < oldest_date:
+            break
+        if record['target'] is None or (targets <= {t.lower() for t in record['target']} and
+                                        distance <= record['distance']):
+            return within_distance(restrict_map({None: record['map']}, [None], target_ontologies), distance)[None]
+    return False
+
+
+def supersede_records(iri_records, record):
+    """
+    Add a new mapping record to those of a source IRI, dropping any older one that it covers: of a query to no other
+    target ontologies, at no greater distance (or, if that is not recorded, without hits outside the new query's)
+    """
+    targets = {t.lower() for t in record['target']}
+
+    def covered(old_record):
+        if old_record['target'] is not None:
+            return {t.lower() for t in old_record['target']} <= targets and old_record['distance'] <= record['distance']
+        return all(o.lower() in targets and all(hit['distance'] <= record['distance'] for hit in hits)
+                   for o, hits in (old_record['map'] or {'ontodict': {}})['ontodict'].items())
+
+    return [old_record for old_record in iri_records if not covered(old_record)] + [record]
+
+
+""" Columns a batch manifest may have, one job per row: cells left empty take the run's own settings """
+MANIFEST_FIELDS = ['input_file', 'output', 'layout', 'target', 'column_name', 'keep', 'file_format']
+LAYOUTS = ['in-situ', 'uni-column', 'multi-column', 'uni-row', 'multi-row']
+
+
+def read_manifest(manifest_file, defaults):
+    """
+    Read a batch manifest: a tab-separated file, with a header row naming the input_file and output columns, plus any
+    others in MANIFEST_FIELDS; several layouts or target ontologies are space-separated, and several column names
+    separated by '|'. Lines starting with '#' are ignored
+    :return list of job dictionaries, each with the keys of defaults:
+    """
+    jobs = []
+    with open(manifest_file, newline='') as mf:
+        manifest_reader = csv.DictReader((line for line in mf if not line.startswith('#')), delimiter='\t')
+        fields = manifest_reader.fieldnames or []
+        unknown_fields = [f for f in fields if f not in MANIFEST_FIELDS]
+        if unknown_fields or not {'input_file', 'output'} <= set(fields):
+            raise SystemExit("Manifest %s needs input_file and output columns, and may only have columns %s" %
+                             (manifest_file, ', '.join(MANIFEST_FIELDS)))
+        for row_number, manifest_row in enumerate(manifest_reader, 2):
+            job = dict(defaults)
+            for field, cell in manifest_row.items():
+                cell = (cell or '').strip()
+                if not cell:
+                    continue
+                if field in {'layout', 'target'}:
+                    job[field] = cell.split()
+                elif field == 'column_name':
+                    job['column_name'] = [c.strip() for c in cell.split('|')]
+                    job['column_index'] = None
+                elif field == 'keep':
+                    if cell.lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+                        raise SystemExit("Manifest %s, line %d: keep should be true or false" %
+                                         (manifest_file, row_number))
+                    job['keep'] = configparser.ConfigParser.BOOLEAN_STATES[cell.lower()]
+                else:
+                    job[field] = cell
+            column_count = len(job['column_name'] if job['column_index'] is None else job['column_index'])
+            if not job['input_file'] or not job['output']:
+                raise SystemExit("Manifest %s, line %d: input_file and output are needed" %
+                                 (manifest_file, row_number))
+            if set(job['layout']) - set(LAYOUTS) or len(job['layout']) not in {1, column_count}:
+                raise SystemExit("Manifest %s, line %d: layout should be one of %s, for all source columns, or "
+                                 "one per column" % (manifest_file, row_number, ', '.join(LAYOUTS)))
+            jobs.append(job)
+    return jobs
+
+
+def restrict_map(iri_map, source_iris, target_ontologies):
+    """
+    Extract the mappings of the given source IRIs, keeping only hits in the given target ontologies, from an IRI
+    dictionary mapped to a wider set of target ontologies
+    """
+    targets = {t.lower() for t in target_ontologies}
+    job_map = {}
+    for source_iri in source_iris:
+        map_dict = iri_map.get(source_iri)
+        job_map[source_iri] = map_dict and {
+            'source_label': map_dict['source_label'],
+            'ontodict': {o: hits for o, hits in map_dict['ontodict'].items() if o.lower() in targets}}
+    return job_map
+
+
+def within_distance(iri_map, distance):
+    """
+    Derive the mappings at a lower OxO distance from those at a greater one, as each hit records its own distance:
+    hits further away are dropped, along with any target ontology left without hits
+    """
+    distance_map = {}
+    for source_iri, map_dict in iri_map.items():
+        if map_dict:
+            ontodict = {o: [hit for hit in hits if hit['distance'] <= distance]
+                        for o, hits in map_dict['ontodict'].items()}
+            map_dict = {'source_label': map_dict['source_label'], 'ontodict': {o: h for o, h in ontodict.items() if h}}
+        distance_map[source_iri] = map_dict
+    return distance_map
+
+
+def distance_outputs(output, distances):
+    """
+    Output file per OxO distance: with several distances, the distance is added to the output filename (e.g.
+    gwas_new.d1.tsv.gz, gwas_new.d3.tsv.gz); with just one, the output is as given
+    :return dictionary of output files, keyed on distance (None, if only one distance, needing no filtering):
+    """
+    if len(distances) == 1:
+        return {None: output}
+    head, tail = os.path.split(output)
+    stem, dot, extensions = tail.partition('.')
+    return {d: os.path.join(head, '%s.d%d%s%s' % (stem, d, dot, extensions)) for d in distances}
+
+
+def source_columns(column_index, column_name, layout):
+    """
+    Source column dictionaries, from column indices if given, else column names, and their layouts: one layout for
+    every source column, or one each
+    """
+    if column_index is not None:
+        column_dicts = [{'index': colno, 'name': None} for colno in column_index]
+    else:
+        column_dicts = [{'index': None, 'name': colname} for colname in column_name]
+    return column_dicts, layout * len(column_dicts) if len(layout) == 1 else layout
+
+
+def run_jobs(workers, job_function, job_args):
+    """
+    Run a function over argument tuples, in a pool of worker processes if more than one: results are in order, and the
+    workers' metrics counters are added to this process's own
+    """
+    if workers <= 1 or len(job_args) <= 1:
+        return [job_function(*args) for args in job_args]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(job_args))) as pool:
+        futures = [pool.submit(counted_job, job_function, args) for args in job_args]
+        job_results = []
+        for future in futures:
+            job_result, job_counters = future.result()
+            for counter_name, counter_value in job_counters.items():
+                ontometrics.count(counter_name, counter_value)
+            job_results.append(job_result)
+        return job_results
+
+
+def counted_job(job_function, args):
+    """ Worker process: run a job, returning its result along with the metrics counters it recorded """
+    ontometrics.take_counters()
+    job_result = job_function(*args)
+    return job_result, ontometrics.take_counters()
+
+
+def manifest_job_iris(job, download_dir):
+    """ Worker process: collect the source IRIs of one manifest job """
+    newsflash("Collecting source IRIs from %s ..." % job['input_file'])
+    return list(collect_iris(job['input_file'], job['separator'], job['ss_columns'], download_dir,
+                             job['input_format']))
+
+
+def manifest_job_output(job, job_map, engine, uri_format, chunk_size, download_dir, low_memory):
+    """
+    Worker process: read, augment and write out the spreadsheet of one manifest job, whose source IRIs are already
+    mapped in job_map
+    :return number of records written:
+    """
+    augment_engine = augment_columnar if engine == 'columnar' else augment
+    writer = ontowriter.SpreadsheetWriter(job['output'], job['output_format'], job['compression'])
+    if chunk_size:
+        def fill_iris(iri_dict):
+            iri_dict.update({iri: job_map.get(iri) for iri in iri_dict})
+        stream_ontologise(job['input_file'], job['separator'], job['ss_columns'], job['layouts'], job['keep'],
+                          uri_format, chunk_size, augment_engine, fill_iris, writer, download_dir, job['input_format'])
+    else:
+        ss_dict = parse_ss(job['input_file'], job['separator'], job['ss_columns'], download_dir, job['input_format'],
+                           lazy=True, low_memory=low_memory)
+        writer.write(augment_columns(ss_dict['load_frame'](), job_map, job['ss_columns'], job['layouts'], job['keep'],
+                                     uri_format, augment_engine))
+        ontometrics.count('rows_out', writer.row_count)
+    writer.close()
+    newsflash("Written %d records to %s" % (writer.row_count, job['output']))
+    return writer.row_count
+
+
+def re_ontologise(input_file, output, output_format, compression, layout, file_format, column_index, column_name, keep,
+                  target, uri_format, distance, paxo, oxo_url, number, verbose, mapping_file, cache_file, cache_ttl,
+                  cache_size, oxo_threads, engine, chunk_size, download_dir, previous_mappings,
+                  previous_max_age, oxo_index_dir, low_memory, mapping_only, journal_file, resume, manifest, workers,
+                  escalate, pipeline, prefixes=None):
 
     target = sorted(target)
+    """ Target terms are written out in the requested format, each converted once, whichever the engine """
+    uri_format = IriFormatter(uri_format, prefixes)
+    """ Mapping is done once, at the greatest distance: outputs at lesser distances are derived from it """
+    distances = sorted(set(distance))
+    max_distance = distances[-1]
     # newsflash("Length of target ontology array is %d" % len(target))
     # for t in target:
     #     newsflash("Target is %s" % t)
     field_separator = ',' if file_format == 'csv' else '\t'
-    ss_column = {'index': column_index, 'name': column_name}
-    ss_dict = parse_ss(input_file, field_separator, ss_column)
-    column_index = ss_column['index']
-    column_name = ss_column['name']
+    ss_columns, layouts = source_columns(column_index, column_name, layout)
+    augment_engine = augment_columnar if engine == 'columnar' else augment
+    """ Without a manifest, several workers split a single (text) spreadsheet into shards, augmented in parallel """
+    shard_workers = workers or 1
+    workers = workers or os.cpu_count() or 1
+
+    jobs = None
+    if manifest is not None:
+        jobs = read_manifest(manifest, {'input_file': None, 'output': None, 'layout': layout, 'target': target,
+                                        'column_name': column_name, 'column_index': column_index, 'keep': keep,
+                                        'file_format': file_format})
+        for job in jobs:
+            job['separator'] = ',' if job['file_format'] == 'csv' else '\t'
+            job['ss_columns'], job['layouts'] = source_columns(job['column_index'], job['column_name'], job['layout'])
+            job['input_format'] = ontowriter.infer_format(job['input_file'], job['file_format'])
+            job['output_format'] = output_format or ontowriter.infer_format(job['output'], job['file_format'])
+            job['compression'] = compression or ontowriter.infer_compression(job['output'])
+        """ A single mapping pass serves every job: to all of their target ontologies """
+        target = sorted({t for job in jobs for t in job['target']})
+        newsflash("Manifest %s: %d jobs, mapping to %s" % (manifest, len(jobs), ' '.join(target)))
+    output_format = output_format or ontowriter.infer_format(output, file_format)
+    compression = compression or ontowriter.infer_compression(output)
+    input_format = ontowriter.infer_format(input_file, file_format)
+
+    if previous_mappings is not None:
+        """ Delta mode: only source IRIs missing from the previous run's mappings (or too old) go to OxO """
+        mapping_records = read_mapping_file(previous_mappings)
+        oldest_date = '' if previous_max_age is None else \
+            (datetime.date.today() - datetime.timedelta(days=previous_max_age)).isoformat()
+        newsflash("Loaded previous mappings for %d source IRIs" % len(mapping_records))
+
+    if oxo_index_dir is not None:
+        mapping_index = oxo_index.open_index(oxo_index_dir)
+
+    journal = None
+    if journal_file is not None and oxo_index_dir is None:
+        journal = ontojournal.open_journal(journal_file, {'input_file': manifest or input_file, 'target': target,
+                                                          'distance': max_distance, 'oxo_url': oxo_url}, resume)
+        newsflash("Journal %s: %d completed OxO batches loaded" % (journal_file, journal['batches']))
+
+    def map_new_iris(iri_dict):
+        with ontometrics.span('map', query_terms=len(iri_dict)):
+            map_known_iris(iri_dict)
+        mapped_count = sum(1 for entry in iri_dict.values() if entry and entry['ontodict'])
+        ontometrics.count('unique_iris', len(iri_dict))
+        ontometrics.count('mapped_iris', mapped_count)
+        ontometrics.count('unmapped_iris', len(iri_dict) - mapped_count)
+
+    def map_known_iris(iri_dict):
+        """
+        Map at the greatest distance; or, escalating, at each distance in turn, re-querying at the next one only the
+        source IRIs still without hits, whose mappings are then as at the least distance they have any hits
+        """
+        tier_dict = iri_dict
+        for tier_distance in distances if escalate else [max_distance]:
+            if tier_distance != distances[0]:
+                newsflash("Escalating %d source IRIs without hits to distance %d ..." % (len(tier_dict), tier_distance))
+            map_at_distance(tier_dict, tier_distance)
+            iri_dict.update(tier_dict)
+            tier_dict = {iri: None for iri, entry in tier_dict.items()
+                         if not (entry and any(entry['ontodict'].values()))}
+            if not tier_dict:
+                break
+
+    def map_at_distance(iri_dict, query_distance):
+        query_dict = iri_dict
+        if previous_mappings is not None:
+            """ Previous mappings are reused if queried recently enough, to the same targets, at least as far """
+            query_dict = {}
+            for iri in iri_dict:
+                map_dict = previous_mapping(mapping_records.get(iri, []), target, query_distance, oldest_date)
+                if map_dict is False:
+                    query_dict[iri] = None
+                else:
+                    iri_dict[iri] = map_dict
+            newsflash("Previous mappings: %d source IRIs already mapped, %d to query" %
+                      (len(iri_dict) - len(query_dict), len(query_dict)))
+        failed_iris = None
+        if oxo_index_dir is not None:
+            newsflash("Calling map_iris_offline with index = '%s' ..." % oxo_index_dir)
+            oxo_index.map_iris_offline(query_dict, target, query_distance, mapping_index, verbose)
+        else:
+            newsflash("Calling map_iris with url = '%s' ..." % oxo_url)
+            failed_iris = map_iris(query_dict, target, query_distance, paxo, oxo_url, number, verbose, cache_file,
+                                   cache_ttl, cache_size, oxo_threads, journal)
+        if previous_mappings is not None:
+            iri_dict.update(query_dict)
+            """ Source IRIs that OxO kept failing on keep their previous records, to be queried again next time """
+            for iri in [iri for iri in query_dict if iri not in (failed_iris or set())]:
+                mapping_records[iri] = supersede_records(mapping_records.get(iri, []), {
+                    'date': datetime.date.today().isoformat(), 'target': target, 'distance': query_distance,
+                    'map': query_dict[iri]})
+
+    def finish_mapping(iri_map):
+        """ Once every source IRI is mapped: close the journal, and write out the mapping file, if any """
+        if journal is not None:
+            ontojournal.close_journal(journal)
+        if previous_mappings is not None:
+            """ Previous records, of source IRIs no longer in the spreadsheet too, are written out with the new ones """
+            write_mapping_file(mapping_file or previous_mappings, iri_map, mapping_records)
+        elif mapping_file is not None:
+            write_mapping_file(mapping_file, iri_map)
+
+    if jobs is not None:
+        """ Source IRIs are collected, and spreadsheets augmented, in worker processes: mapping is done here, once """
+        with ontometrics.span('extract_iris', jobs=len(jobs)):
+            job_iris = run_jobs(workers, manifest_job_iris, [(job, download_dir) for job in jobs])
+        iri_map = dict.fromkeys(iri for source_iris in job_iris for iri in source_iris)
+        newsflash("Manifest: %d unique source IRIs, from %d in all jobs" %
+                  (len(iri_map), sum(len(source_iris) for source_iris in job_iris)))
+        map_new_iris(iri_map)
+        finish_mapping(iri_map)
+        if not mapping_only:
+            job_args = []
+            for job, source_iris in zip(jobs, job_iris):
+                job_map = restrict_map(iri_map, source_iris, job['target'])
+                for out_distance, distance_output in distance_outputs(job['output'], distances).items():
+                    job_args.append((dict(job, output=distance_output),
+                                     job_map if out_distance is None else within_distance(job_map, out_distance),
+                                     engine, uri_format, chunk_size, download_dir, low_memory))
+            with ontometrics.span('output', jobs=len(job_args)):
+                run_jobs(workers, manifest_job_output, job_args)
+        return
+
+    if mapping_only:
+        """ No output spreadsheet: just collect, map and write out the source IRIs """
+        iri_map = collect_iris(input_file, field_separator, ss_columns, download_dir, input_format)
+        map_new_iris(iri_map)
+        finish_mapping(iri_map)
+        return
+
+    outputs = distance_outputs(output, distances)
+    if chunk_size or pipeline:
+        writers = {d: ontowriter.SpreadsheetWriter(outputs[d], output_format, compression) for d in outputs}
+        iri_map = stream_ontologise(input_file, field_separator, ss_columns, layouts, keep, uri_format,
+                                    chunk_size or PIPELINE_CHUNK_SIZE, augment_engine, map_new_iris, writers,
+                                    download_dir, input_format, pipeline)
+        for writer in writers.values():
+            writer.close()
+        newsflash("No. of unique IRIs: %d" % len(iri_map))
+        finish_mapping(iri_map)
+        return
+
+    if shard_workers > 1 and input_format in {'csv', 'tsv'} and not input_file.endswith('.gz'):
+        writers = {d: ontowriter.SpreadsheetWriter(outputs[d], output_format, compression) for d in outputs}
+        iri_map = shard_ontologise(input_file, field_separator, ss_columns, layouts, keep, uri_format, augment_engine,
+                                   map_new_iris, writers, shard_workers, download_dir)
+        for writer in writers.values():
+            writer.close()
+        newsflash("No. of unique IRIs: %d" % len(iri_map))
+        finish_mapping(iri_map)
+        return
+
+    ss_dict = parse_ss(input_file, field_separator, ss_columns, download_dir, input_format, lazy=True,
+                       low_memory=low_memory)
     iri_map = ss_dict['unique_iris']
     """ Print out list of source iris in iri_map """
     # iri_counter = 0
@@ -300,28 +1612,13 @@ def re_ontologise(input_file, output, layout, file_format, column_index, column_
         ### print("%d\t%s\t%s" % (iri_counter, src_iri, iri_map[src_iri]))  # Print values _and_ keys
         # newsflash("%d\t%s" % (iri_counter, src_iri))
         # iri_counter += 1
-    panda_original = ss_dict['pandafued']
-    newsflash("Calling map_iris with url = '%s' ..." % oxo_url)
-    map_iris(iri_map, target, distance, paxo, oxo_url, number, verbose)
+    map_new_iris(iri_map)
 
     """ Print a tab-separated list of source and target terms, if --mapping-file switch specified """
-    if mapping_file is not None:
-        with open(mapping_file, 'w') as emf:
-            for efo_iri in iri_map.keys():
-                # for efo_map in iri_map[efo_iri].values():
-                #     for efo_single in efo_map.split(', '):
-                #         print("%s\t%s" % (efo_iri, efo_single), file=emf)
-                ## for efo_map in iri_map[efo_iri]:
-                for efo_map in iri_map[efo_iri]['ontodict'].values():
-                    for efo_single in efo_map:
-                        print("%s\t%s\t%s\t%s\t%d" % (efo_iri, iri_map[efo_iri]['source_label'], efo_single['curie'],
-                                                      efo_single['target_label'], efo_single['distance']), file=emf)
-
-    newsflash("Calling augment ...")
-    ontologically_enriched = augment(panda_original, iri_map, layout, column_index, keep, uri_format)
-    """ Print out augmented_panda here ... """
-    # newsflash("No. of dictionary elements: %d" % len(ss_dict))
-    # newsflash("No. of rows in spreadsheet: %d" % len(panda_original))
+    finish_mapping(iri_map)
+
+    """ The rest of the spreadsheet is only needed now, once mapping is done """
+    panda_original = ss_dict['load_frame']()
     newsflash("No. of unique IRIs: %d" % len(iri_map))
     newsflash('', verbose)
     newsflash(ss_dict['unique_iris'], verbose)
@@ -332,9 +1629,23 @@ def re_ontologise(input_file, output, layout, file_format, column_index, column_
     # for iri_key in ss_dict['unique_iris']:
     #     newsflash(iri_key)
     # newsflash(ss_dict['unique_iris'])
-    newsflash("Outputting ontologically enriched spreadsheet ...")
-    # print(ontologically_enriched.head(30).to_csv(index=False, sep='\t'))
-    print(ontologically_enriched.to_csv(index=False, sep=field_separator))
+    for out_distance, distance_output in outputs.items():
+        distance_map = iri_map if out_distance is None else within_distance(iri_map, out_distance)
+        newsflash("Calling augment ..." if out_distance is None else
+                  "Calling augment, at distance %d ..." % out_distance)
+        with ontometrics.span('augment', distance=out_distance):
+            ontologically_enriched = augment_columns(panda_original, distance_map, ss_columns, layouts, keep,
+                                                     uri_format, augment_engine)
+        """ Print out augmented_panda here ... """
+        # newsflash("No. of dictionary elements: %d" % len(ss_dict))
+        # newsflash("No. of rows in spreadsheet: %d" % len(panda_original))
+        newsflash("Outputting ontologically enriched spreadsheet ...")
+        # print(ontologically_enriched.head(30).to_csv(index=False, sep='\t'))
+        with ontometrics.span('output', output_format=output_format, compression=compression):
+            writer = ontowriter.SpreadsheetWriter(distance_output, output_format, compression)
+            writer.write(ontologically_enriched)
+            writer.close()
+        ontometrics.count('rows_out', len(ontologically_enriched))
 
 
 def main():
@@ -356,6 +1667,9 @@ def main():
         real_targets = dict(set(targets_plus) - set(spurious_targets))
         # newsflash(pd.Series(real_targets))
         target_list = list(real_targets.values())
+    prefix_table = {}
+    if ontoconfig.has_section('Prefixes'):
+        prefix_table = dict(set(ontoconfig.items('Prefixes')) - set(ontoconfig.items('DEFAULT')))
 
     """ Third of all, parse the rest of the switches, possibly using defaults from configuration file """
     parser2 = argparse.ArgumentParser(prog='Ontomapper',
@@ -367,20 +1681,49 @@ def main():
     cfg_sect_lookup = config_or_bust(ontoconfig, 'Params')
     parser2.add_argument('-i', '--input-file', default=cfg_sect_lookup('input_file', 'string'),
                          help='location of input spreadsheet: accepts filepath or URL')
+    parser2.add_argument('--manifest', default=cfg_sect_lookup('manifest', 'string'),
+                         help="%s%s%s" % ('tab-separated list of jobs (input_file, output, and optionally layout, ',
+                                          'target, column_name, keep, file_format) run in one process: their source ',
+                                          'terms are mapped together, in a single pass; --input-file is then ignored'))
+    parser2.add_argument('-W', '--workers', type=int, default=cfg_sect_lookup('workers', 'int'),
+                         help="%s%s%s" % ('number of worker processes reading and writing manifest spreadsheets ',
+                                          '(default: CPUs); without a manifest, the input spreadsheet (csv or tsv) is ',
+                                          'split into this many shards, parsed and augmented in parallel'))
+    parser2.add_argument('-w', '--download-dir', default=cfg_sect_lookup('download_dir', 'string'),
+                         help='directory caching downloaded spreadsheets, revalidated with the server on each run')
     parser2.add_argument('-o', '--output', default=cfg_sect_lookup('output', 'string'),
-                         help='output spreadsheet filepath **NO CURRENT EFFECT**')
+                         help='output spreadsheet filepath (standard output if omitted, or \'-\')')
+    parser2.add_argument('-O', '--output-format', choices=ontowriter.OUTPUT_FORMATS,
+                         default=cfg_sect_lookup('output_format', 'string'),
+                         help="%s%s" % ('output spreadsheet format: Parquet and Arrow need pyarrow; by default, taken ',
+                                        'from the output filename extension, or else the same as the input'))
+    parser2.add_argument('-Z', '--compression', choices=ontowriter.COMPRESSIONS,
+                         default=cfg_sect_lookup('compression', 'string'),
+                         help="%s%s" % ('compression of output spreadsheet (zstd needs zstandard, unless Parquet or ',
+                                        'Arrow); by default, taken from the output filename extension (.gz or .zst)'))
     parser2.add_argument('-f', '--file-format', choices=['csv', 'tsv'],
                          default=cfg_sect_lookup('file_format', 'string'),
-                         help='file format (both input and output)')
-    parser2.add_argument('-l', '--layout', choices=['in-situ', 'uni-column', 'multi-column', 'uni-row', 'multi-row'],
-                         default=cfg_sect_lookup('layout', 'string'),
-                         help="%s%s" % ('whether new ontology terms are required in multiple rows, ',
-                                        'multiple columns, a single row, a single column, or the originating cell'))
+                         help="%s%s" % ('text file format (both input and output); Parquet and Arrow / Feather input ',
+                                        'are recognised by filename extension (.parquet, .arrow, .feather)'))
+    cfg_layout = cfg_sect_lookup('layout', 'string')
+    parser2.add_argument('-l', '--layout', choices=LAYOUTS,
+                         nargs='+', default=None if cfg_layout is None else cfg_layout.split(),
+                         help="%s%s%s" % ('whether new ontology terms are required in multiple rows, ',
+                                          'multiple columns, a single row, a single column, or the originating cell: ',
+                                          'one layout for all source columns, or one per source column'))
+    """ Several column names may be configured, one per line, as column names may contain spaces """
+    cfg_column_name = cfg_sect_lookup('column_name', 'string')
     cmeg = parser2.add_mutually_exclusive_group(required=False)
-    cmeg.add_argument('-x', '--column-index', type=int,  # default=cfg_sect_lookup('column_index', 'int'),
-                      help='zero-based index of column containing source ontology terms')
-    cmeg.add_argument('-c', '--column-name', default=cfg_sect_lookup('column_name', 'string'),
-                      help='name or heading of column containing source ontology terms')
+    cmeg.add_argument('-x', '--column-index', type=int, nargs='+',  # default=cfg_sect_lookup('column_index', 'int'),
+                      help='zero-based index (or indices) of column(s) containing source ontology terms')
+    cmeg.add_argument('-c', '--column-name', nargs='+',
+                      default=None if cfg_column_name is None else cfg_column_name.strip().splitlines(),
+                      help="%s%s" % ('name or heading of column containing source ontology terms: several columns may ',
+                                     'be given, whose terms are mapped together, and augmented one after another'))
+    parser2.add_argument('-y', '--engine', choices=['loop', 'columnar'],
+                         default=cfg_sect_lookup('engine', 'string') or 'loop',
+                         help="%s%s" % ('augmentation engine: row-by-row loop (default), or vectorised columnar ',
+                                        'implementation (identical output)'))
     kmeg = parser2.add_mutually_exclusive_group(required=False)
     kmeg.add_argument('-k', '--keep', dest='keep', action='store_true', help='retain source ontology terms')
     kmeg.add_argument('-e', '--no-keep', dest='keep', action='store_false', help='ditch source ontology terms')
@@ -388,17 +1731,42 @@ def main():
                          help='space-separated list of target ontology prefixes')
     parser2.add_argument('-u', '--uri-format', choices=['long', 'short', 'curie'],
                          default=cfg_sect_lookup('uri_format', 'string'),
-                         help='format of target ontology term identifiers **NO CURRENT EFFECT**')
-    parser2.add_argument('-d', '--distance', type=int, default=cfg_sect_lookup('distance', 'int'), choices=[1, 2, 3],
-                         help='stepwise OxO distance (ontology to ontology)')
+                         help="%s%s" % ('format of target ontology term identifiers: full IRIs (namespaces from the ',
+                                        '[Prefixes] section of the config), short forms (PREFIX_ID), or CURIEs'))
+    cfg_distance = cfg_sect_lookup('distance', 'string')
+    parser2.add_argument('-d', '--distance', type=int, nargs='+', choices=[1, 2, 3],
+                         default=None if cfg_distance is None else [int(d) for d in cfg_distance.split()],
+                         help="%s%s%s" % ('stepwise OxO distance (ontology to ontology): given several, OxO is ',
+                                          'queried once, at the greatest, and one output is written per distance, ',
+                                          'with the distance added to the output filename (e.g. gwas_new.d1.tsv)'))
+    parser2.add_argument('--escalate', action='store_true', default=cfg_sect_lookup('escalate', 'boolean'),
+                         help="%s%s" % ('with several distances, query at the least first, and only source terms ',
+                                        'without hits there at the next distance, and so on, to cut down OxO replies'))
     parser2.add_argument('-r', '--oxo-url', default=cfg_sect_lookup('oxo_url', 'string'),
                          help='OxO (or Paxo) web service URL')
+    parser2.add_argument('-X', '--oxo-index', dest='oxo_index_dir', default=cfg_sect_lookup('oxo_index', 'string'),
+                         help="%s%s" % ('directory holding an offline index of bulk OxO mappings (built by ',
+                                        'oxo_index.py), used instead of the OxO web service'))
     pmeg = parser2.add_mutually_exclusive_group(required=False)
     pmeg.add_argument('-p', '--paxo', dest='paxo', action='store_true',
                       help='use Paxo rather than OxO **NO CURRENT EFFECT**')
     pmeg.add_argument('-z', '--no-paxo', dest='paxo', action='store_false', help='do not use Paxo: use OxO')
     parser2.add_argument('-n', '--number', type=int, default=cfg_sect_lookup('query_term_number', 'int'),
-                         help='number of query terms to chunk, per HTTP request on the OxO web service')
+                         help="%s%s" % ('initial number of query terms to chunk, per HTTP request on the OxO web ',
+                                        'service: adapts to how quickly OxO replies, and shrinks on failed requests'))
+    parser2.add_argument('-j', '--oxo-threads', type=int, default=cfg_sect_lookup('oxo_threads', 'int') or 4,
+                         help="%s%s" % ('maximum number of chunked HTTP requests sent concurrently to the OxO web ',
+                                        'service (default 4)'))
+    parser2.add_argument('-s', '--chunk-size', type=int, default=cfg_sect_lookup('chunk_size', 'int'),
+                         help="%s%s" % ('stream the spreadsheet in chunks of this many rows, mapping and writing out ',
+                                        'each chunk in turn, to bound memory use on huge spreadsheets'))
+    parser2.add_argument('--pipeline', action='store_true', default=cfg_sect_lookup('pipeline', 'boolean'),
+                         help="%s%s%s" % ('stream the spreadsheet in chunks (as --chunk-size, by default of %d ' %
+                                          PIPELINE_CHUNK_SIZE, 'rows), mapping the source terms of each in the ',
+                                          'background, while the next are downloaded and parsed'))
+    parser2.add_argument('-L', '--low-memory', action='store_true', default=cfg_sect_lookup('low_memory', 'boolean'),
+                         help="%s%s" % ('hold the source term column, and other repetitive text columns, as ',
+                                        'categoricals (interned integer codes), to cut memory use'))
     vmeg = parser2.add_mutually_exclusive_group(required=False)
     vmeg.add_argument('-v', '--verbose', dest='verbose', action='store_true',
                       help="%s%s" % ('send verbose progess reports to standard error: ',
@@ -406,6 +1774,31 @@ def main():
     vmeg.add_argument('-q', '--quiet', dest='verbose', action='store_false', help='suppress verbose output')
     parser2.add_argument('-m', '--mapping-file',  # default=cfg_sect_lookup('mapping_file', 'string'),
                          help='optional extra output file with tab-separated list of source to target term mappings')
+    parser2.add_argument('--mapping-only', action='store_true', default=cfg_sect_lookup('mapping_only', 'boolean'),
+                         help="%s%s" % ('only write the mapping file: source terms are collected without pandas, and ',
+                                        'no output spreadsheet is generated'))
+    parser2.add_argument('-J', '--journal', dest='journal_file', default=cfg_sect_lookup('journal', 'string'),
+                         help="%s%s" % ('append-only journal of completed OxO batches, from which a run that dies ',
+                                        'part-way may be resumed (see --resume)'))
+    parser2.add_argument('--resume', action='store_true', default=cfg_sect_lookup('resume', 'boolean'),
+                         help="%s%s" % ('resume from the journal: journalled source terms are not re-queried (a ',
+                                        'complete journal lets a run be repeated, e.g. with another layout, offline)'))
+    parser2.add_argument('-P', '--previous-mappings', default=cfg_sect_lookup('previous_mappings', 'string'),
+                         help="%s%s" % ('mapping file from a previous run: only source terms missing from it (or ',
+                                        'mapped to fewer targets, or less far) are sent to OxO, and a merged, dated '
+                                        'mapping file is written (to itself by default)'))
+    parser2.add_argument('--previous-max-age', type=float, default=cfg_sect_lookup('previous_max_age', 'float'),
+                         help='age in days beyond which previous mappings are re-queried')
+    parser2.add_argument('-M', '--metrics-file', default=cfg_sect_lookup('metrics_file', 'string'),
+                         help='optional JSON output file of per-stage timings and counters')
+    parser2.add_argument('--profile', default=cfg_sect_lookup('profile', 'string'),
+                         help='optional directory for cProfile and tracemalloc dumps of the hot pipeline stages')
+    parser2.add_argument('-a', '--cache-file', default=cfg_sect_lookup('cache_file', 'string'),
+                         help='optional SQLite file caching OxO mappings between runs')
+    parser2.add_argument('--cache-ttl', type=float, default=cfg_sect_lookup('cache_ttl', 'float'),
+                         help='age in hours after which cached OxO mappings are re-queried')
+    parser2.add_argument('--cache-size', type=int, default=cfg_sect_lookup('cache_size', 'int'),
+                         help='maximum number of entries kept in the OxO mapping cache (least recently used evicted)')
     # parser2.add_argument('-b', '--boundary', type=int, default=cfg_sect_lookup('boundary', 'int'),
     #                      help="%s%s" % ('minimum percentage confidence threshold of target ontology term matches ',
     #                                     '**NO CURRENT EFFECT: ENFORCE 100%% CONFIDENCE (OxO distance=1)**'))
@@ -426,7 +1819,8 @@ def main():
     newsflash("These are your opening parameters:")
     newsflash()
     # newsflash("Length of args dictionary is %d" % len(arg_dict))
-    newsflash(pd.Series(arg_dict))
+    for arg_key in arg_dict:
+        newsflash("%-18s %s" % (arg_key, arg_dict[arg_key]))
     newsflash()
 
     """ config is still in arg_dict at this point """
@@ -434,8 +1828,14 @@ def main():
 
     """ Don't check values of reserved options, which have no effect at the moment; also, column_index may be null """
     active_arg_dict = arg_dict.copy()
-    for inactive_arg in ['output', 'paxo', 'uri_format', 'column_index', 'mapping_file']:
+    for inactive_arg in ['output', 'output_format', 'compression', 'paxo', 'uri_format', 'column_index',
+                         'mapping_file', 'cache_file', 'cache_ttl', 'cache_size', 'chunk_size', 'download_dir',
+                         'previous_mappings', 'previous_max_age', 'oxo_index_dir', 'metrics_file', 'profile',
+                         'low_memory', 'mapping_only', 'journal_file', 'resume', 'manifest', 'workers', 'escalate',
+                         'pipeline']:
         active_arg_dict.pop(inactive_arg)
+    if arg_dict['manifest'] is not None:
+        active_arg_dict.pop('input_file')
     if None in active_arg_dict.values():
         newsflash()
         newsflash("Please set values for the following parameters---on command line or in config file!")
@@ -448,8 +1848,35 @@ def main():
 
     newsflash(arg_dict, arg_dict['verbose'])
 
+    source_columns = arg_dict['column_name'] if arg_dict['column_index'] is None else arg_dict['column_index']
+    if len(set(source_columns)) < len(source_columns):
+        newsflash("Source term columns must be distinct!")
+        sys.exit(1)
+    if len(arg_dict['layout']) not in {1, len(source_columns)}:
+        newsflash("Please give one layout for all source term columns, or one per column!")
+        sys.exit(1)
+
+    if len(set(arg_dict['distance'])) > 1 and arg_dict['output'] in {None, '-', '/dev/stdout'} and \
+            arg_dict['manifest'] is None and not arg_dict['mapping_only']:
+        newsflash("Several distances need an output filename (--output), from which to name one output per distance!")
+        sys.exit(1)
+
+    if arg_dict['mapping_only'] and arg_dict['mapping_file'] is None and arg_dict['previous_mappings'] is None:
+        newsflash("Mapping-only mode needs a mapping file (--mapping-file or --previous-mappings) to write to!")
+        sys.exit(1)
+
+    """ Instrumentation switches are dealt with here, rather than passed on """
+    metrics_file = arg_dict.pop('metrics_file')
+    profile_dir = arg_dict.pop('profile')
+    if profile_dir is not None:
+        ontometrics.enable_profiling(profile_dir)
+
     """ '**' unpacks a dictionary """
-    re_ontologise(**arg_dict)
+    re_ontologise(prefixes=prefix_table, **arg_dict)
+
+    if metrics_file is not None:
+        ontometrics.write_metrics(metrics_file)
+        newsflash("Metrics written to %s" % metrics_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+
+"""
+Instrumentation for the ontomapper pipeline: timed spans (download, parse, IRI extraction, each OxO request, augment,
+output ...) and counters (rows in and out, unique IRIs, OxO calls, bytes transferred, mapped and unmapped IRIs), kept
+in module-level state, so that any function can record them without extra parameters. Everything may be written out as
+JSON at the end of a run; optionally, the hot stages are also profiled with cProfile and tracemalloc.
+"""
+
+
+PROFILED_STAGES = ['parse', 'map', 'augment', 'output']
+
+_lock = threading.Lock()
+_run_start = time.time()
+_spans = []
+_counters = {}
+_profiling = {'dir': None, 'active': False, 'profiles': {}}
+
+
+def enable_profiling(profile_dir):
+    """ Profile the hot stages of the pipeline, dumping cProfile and tracemalloc statistics into the given directory """
+    os.makedirs(profile_dir, exist_ok=True)
+    _profiling['dir'] = profile_dir
+    tracemalloc.start()
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    Time the enclosed block, recording it under the given stage name; the yielded dictionary of attributes may be
+    added to inside the block. Hot stages run in the main thread are profiled too, if profiling is enabled.
+    """
+    profiler = None
+    if (_profiling['dir'] is not None and name in PROFILED_STAGES and not _profiling['active'] and
+            threading.current_thread() is threading.main_thread()):
+        _profiling['active'] = True
+        profiler = _profiling['profiles'].setdefault(name, cProfile.Profile())
+        if hasattr(tracemalloc, 'reset_peak'):
+            """ Before Python 3.9, the peak recorded for a stage is that of the run so far """
+            tracemalloc.reset_peak()
+        profiler.enable()
+    t0 = time.time()
+    try:
+        yield attrs
+    finally:
+        seconds = time.time() - t0
+        if profiler is not None:
+            profiler.disable()
+            _profiling['active'] = False
+            attrs['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+            dump_profile(name, profiler)
+        with _lock:
+            _spans.append(dict(attrs, name=name, start=round(t0 - _run_start, 4), seconds=round(seconds, 4),
+                               thread=threading.current_thread().name))
+
+
+def dump_profile(name, profiler):
+    """ Write cumulative cProfile statistics, and the top allocation sites, for a profiled stage """
+    profiler.dump_stats(os.path.join(_profiling['dir'], '%s.prof' % name))
+    with open(os.path.join(_profiling['dir'], '%s.txt' % name), 'w') as stats_file:
+        pstats.Stats(profiler, stream=stats_file).sort_stats('cumulative').print_stats(40)
+        stats_file.write('\nTop allocation sites (tracemalloc):\n')
+        for stat in tracemalloc.take_snapshot().statistics('lineno')[:30]:
+            stats_file.write('%s\n' % stat)
+
+
+def count(name, increment=1):
+    """ Add to a named counter """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + increment
+
+
+def take_counters():
+    """ Return the counters recorded so far, and reset them: for worker processes to hand their counts back """
+    with _lock:
+        counters = dict(_counters)
+        _counters.clear()
+    return counters
+
+
+def metrics():
+    """
+    Summarise spans and counters recorded so far
+    :return dictionary of per-stage totals, individual spans and counters:
+    """
+    with _lock:
+        spans = list(_spans)
+        counters = dict(_counters)
+    stages = {}
+    for s in spans:
+        stage = stages.setdefault(s['name'], {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stage['count'] += 1
+        stage['seconds'] = round(stage['seconds'] + s['seconds'], 4)
+        stage['max_seconds'] = max(stage['max_seconds'], s['seconds'])
+    return {'wall_seconds': round(time.time() - _run_start, 4), 'stages': stages, 'counters': counters,
+            'spans': spans}
+
+
+def write_metrics(metrics_file):
+    """ Write the metrics summary to a JSON file """
+    with open(metrics_file, 'w') as mf:
+        json.dump(metrics(), mf, indent=1)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import argparse
+import configparser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import ontolib
+import ontomapper
+from spotilities import newsflash
+from spotilities import config_or_bust
+import os
+import sys
+import urllib.parse
+
+
+"""
+Long-running local mapping service, for interactive tools that would otherwise run ontomapper.py once per request.
+
+The config, the imports, the HTTP session to OxO and the source IRIs mapped so far are kept warm in memory, so that
+a request only costs OxO calls for source IRIs the service has not seen (recently). Endpoints (on localhost by default):
+
+    POST /map        source IRIs, as a JSON list (or {"iris": [...]}), or as plain text, one per line: replies with a
+                     JSON object, mapping each IRI to its entry in the IRI dictionary (null if unmapped)
+    POST /augment    a csv or tsv spreadsheet: replies with the augmented spreadsheet, as ontomapper.py would write it;
+                     query parameters 'column' (repeatable), 'layout' (one, or one per column), 'keep' and 'format'
+                     override the service's defaults
+    GET  /status     counts of requests, source IRIs held, and queries sent upstream
+
+Mapping is done by an ontolib.OntoMapper, which holds the most recently used mappings (up to --lru-size source IRIs),
+and coalesces concurrent requests for the same source IRIs: an IRI already being queried on behalf of one request is
+not queried again for another, which waits for the first query's answer instead.
+"""
+
+
+def augment_text(mapper, spreadsheet_text, file_format, column_names, layouts, keep):
+    """ Augment a csv or tsv spreadsheet, held as a string, returning the augmented spreadsheet as a string """
+    separator = ',' if file_format == 'csv' else '\t'
+    panda_input = ontomapper.pd.read_csv(io.StringIO(spreadsheet_text), sep=separator, low_memory=False,
+                                         keep_default_na=False)
+    panda_output = mapper.augment_frame(panda_input, column_names, layouts, keep)
+    return panda_output.to_csv(index=False, sep=separator)
+
+
+def service_handler(mapper, defaults):
+
+    class MappingServiceHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            newsflash("%s - %s" % (self.address_string(), format % args), mapper.verbose)
+
+        def reply(self, status, body, content_type='application/json'):
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urllib.parse.urlparse(self.path).path.rstrip('/') != '/status':
+                self.send_error(404)
+                return
+            self.reply(200, json.dumps(mapper.status()))
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            payload = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            try:
+                if url.path.rstrip('/') == '/map':
+                    if self.headers.get('Content-Type', '').startswith('application/json'):
+                        source_iris = json.loads(payload)
+                        source_iris = source_iris['iris'] if isinstance(source_iris, dict) else source_iris
+                    else:
+                        source_iris = [line.strip() for line in payload.splitlines() if line.strip()]
+                    self.reply(200, json.dumps(mapper.resolve(source_iris)))
+                elif url.path.rstrip('/') == '/augment':
+                    file_format = query.get('format', [defaults['file_format']])[0]
+                    keep = query.get('keep', [str(mapper.keep)])[0].lower()
+                    if file_format not in {'csv', 'tsv'} or keep not in configparser.ConfigParser.BOOLEAN_STATES:
+                        raise ValueError("format should be csv or tsv, and keep true or false")
+                    self.reply(200, augment_text(mapper, payload, file_format, query.get('column'),
+                                                 query.get('layout'), configparser.ConfigParser.BOOLEAN_STATES[keep]),
+                               'text/csv' if file_format == 'csv' else 'text/tab-separated-values')
+                else:
+                    self.send_error(404)
+            except (ValueError, KeyError, TypeError, ontomapper.pd.errors.ParserError) as request_error:
+                self.reply(400, json.dumps({'error': str(request_error)}))
+            except Exception as service_error:
+                newsflash("Request failed: %s" % service_error)
+                self.reply(502, json.dumps({'error': str(service_error)}))
+
+    return MappingServiceHandler
+
+
+def main():
+
+    """ First of all, check configuration file """
+    parser1 = argparse.ArgumentParser(description='Config filepath', add_help=False)
+    parser1.add_argument('-g', '--config', help='filepath of config file (ini format)')
+    namespace, extra = parser1.parse_known_args()
+    config_file = namespace.config
+
+    """ Second of all, get configuration info from configuration file (if specified) """
+    ontoconfig = configparser.ConfigParser(os.environ)
+    ontoconfig.optionxform = str
+    target_list = None
+    if config_file is not None:
+        ontoconfig.read(config_file)
+        targets_plus = ontoconfig.items('Targets')
+        spurious_targets = ontoconfig.items('DEFAULT')
+        target_list = list(dict(set(targets_plus) - set(spurious_targets)).values())
+    prefix_table = {}
+    if ontoconfig.has_section('Prefixes'):
+        prefix_table = dict(set(ontoconfig.items('Prefixes')) - set(ontoconfig.items('DEFAULT')))
+
+    """ Third of all, parse the rest of the switches, possibly using defaults from configuration file """
+    parser2 = argparse.ArgumentParser(prog='Ontoserver',
+                                      description="%s%s" %
+                                                  ('Serves ontomapper.py mappings and augmented spreadsheets over ',
+                                                   'HTTP, keeping mappings and the OxO session warm between requests.'),
+                                      parents=[parser1])
+    cfg_sect_lookup = config_or_bust(ontoconfig, 'Params')
+    cfg_layout = cfg_sect_lookup('layout', 'string')
+    cfg_column_name = cfg_sect_lookup('column_name', 'string')
+    parser2.add_argument('-b', '--host', default='127.0.0.1', help='address to listen on (localhost by default)')
+    parser2.add_argument('-p', '--port', type=int, default=8780, help='port to listen on')
+    parser2.add_argument('-t', '--target', nargs='+', default=target_list,
+                         help='space-separated list of target ontology prefixes')
+    """ The config may list several distances, for ontomapper.py: the service maps at the greatest """
+    cfg_distance = cfg_sect_lookup('distance', 'string')
+    parser2.add_argument('-d', '--distance', type=int, choices=[1, 2, 3],
+                         default=None if cfg_distance is None else max(int(d) for d in cfg_distance.split()),
+                         help='stepwise OxO distance (ontology to ontology)')
+    parser2.add_argument('-r', '--oxo-url', default=cfg_sect_lookup('oxo_url', 'string'),
+                         help='OxO (or Paxo) web service URL')
+    parser2.add_argument('-n', '--number', type=int, default=cfg_sect_lookup('query_term_number', 'int'),
+                         help='initial number of query terms to chunk, per HTTP request on the OxO web service')
+    parser2.add_argument('-j', '--oxo-threads', type=int, default=cfg_sect_lookup('oxo_threads', 'int') or 4,
+                         help="%s%s" % ('maximum number of chunked HTTP requests sent concurrently to the OxO web ',
+                                        'service (default 4)'))
+    parser2.add_argument('-a', '--cache-file', default=cfg_sect_lookup('cache_file', 'string'),
+                         help='optional SQLite file caching OxO mappings between runs')
+    parser2.add_argument('--cache-ttl', type=float, default=cfg_sect_lookup('cache_ttl', 'float'),
+                         help='age in hours after which cached OxO mappings are re-queried')
+    parser2.add_argument('--cache-size', type=int, default=cfg_sect_lookup('cache_size', 'int'),
+                         help='maximum number of entries kept in the OxO mapping cache (least recently used evicted)')
+    parser2.add_argument('--lru-size', type=int, default=cfg_sect_lookup('lru_size', 'int'),
+                         help="%s%s" % ('maximum number of source IRIs whose mappings are held in memory (least ',
+                                        'recently used evicted; default %d)' % ontolib.DEFAULT_LRU_SIZE))
+    parser2.add_argument('-f', '--file-format', choices=['csv', 'tsv'],
+                         default=cfg_sect_lookup('file_format', 'string'),
+                         help='default format of spreadsheets sent to /augment')
+    parser2.add_argument('-l', '--layout', choices=ontomapper.LAYOUTS, nargs='+',
+                         default=None if cfg_layout is None else cfg_layout.split(),
+                         help='default layout of spreadsheets sent to /augment')
+    parser2.add_argument('-c', '--column-name', nargs='+',
+                         default=None if cfg_column_name is None else cfg_column_name.strip().splitlines(),
+                         help='default source term column(s) of spreadsheets sent to /augment')
+    parser2.add_argument('-y', '--engine', choices=['loop', 'columnar'], default=cfg_sect_lookup('engine', 'string'),
+                         help='augmentation engine')
+    parser2.add_argument('-u', '--uri-format', choices=['long', 'short', 'curie'],
+                         default=cfg_sect_lookup('uri_format', 'string'),
+                         help='format of target ontology term identifiers')
+    kmeg = parser2.add_mutually_exclusive_group(required=False)
+    kmeg.add_argument('-k', '--keep', dest='keep', action='store_true', help='retain source ontology terms')
+    kmeg.add_argument('-e', '--no-keep', dest='keep', action='store_false', help='ditch source ontology terms')
+    vmeg = parser2.add_mutually_exclusive_group(required=False)
+    vmeg.add_argument('-v', '--verbose', dest='verbose', action='store_true', help='log every request')
+    vmeg.add_argument('-q', '--quiet', dest='verbose', action='store_false', help='suppress verbose output')
+    parser2.set_defaults(keep=cfg_sect_lookup('keep', 'boolean'), verbose=cfg_sect_lookup('verbose', 'boolean'))
+
+    args = parser2.parse_args()
+    arg_dict = vars(args)
+    arg_dict.pop('config')
+    missing_args = [arg_key for arg_key in ['target', 'distance', 'oxo_url', 'number', 'oxo_threads']
+                    if arg_dict[arg_key] is None]
+    if missing_args:
+        newsflash("Please set values for the following parameters---on command line or in config file!")
+        for cfg_key in missing_args:
+            newsflash("\t%s" % cfg_key)
+        sys.exit(1)
+
+    mapper = ontolib.OntoMapper(args.target, args.distance, args.oxo_url, args.number, args.oxo_threads,
+                                args.column_name or [], args.layout or ['multi-column'], bool(args.keep),
+                                args.engine or 'loop', args.uri_format, prefix_table, args.cache_file, args.cache_ttl,
+                                args.cache_size, args.lru_size or ontolib.DEFAULT_LRU_SIZE, args.verbose)
+    defaults = {'file_format': args.file_format or 'tsv'}
+    server = ThreadingHTTPServer((args.host, args.port), service_handler(mapper, defaults))
+    newsflash("Ontomapper service listening on http://%s:%d/ (map, augment, status) ..." % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        mapper.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import gzip
+import io
+import re
+import sys
+import urllib.parse
+
+
+"""
+Incremental writer for output spreadsheets: DataFrames (whole, or chunk by chunk in streaming mode) are written
+straight to the output file, optionally compressed, as csv, tsv, Parquet or Arrow IPC (Feather v2), without first being
+rendered into one large string. Parquet and Arrow output need pyarrow; zstd compression of text output needs zstandard.
+"""
+
+
+OUTPUT_FORMATS = ['csv', 'tsv', 'parquet', 'arrow']
+COMPRESSIONS = ['none', 'gzip', 'zstd']
+
+
+def infer_format(filepath, default_format):
+    """
+    Spreadsheet format implied by the extension of a filepath or URL (ignoring any compression suffix), else the
+    default: used for input as well as output spreadsheets
+    """
+    stem = re.sub(r'\.(gz|zst)$', '', urllib.parse.urlparse(filepath or '').path)
+    for pattern, file_format in [(r'\.(parquet|pq)$', 'parquet'), (r'\.(arrow|feather|ipc)$', 'arrow'),
+                                 (r'\.csv$', 'csv'), (r'\.tsv$', 'tsv')]:
+        if re.search(pattern, stem):
+            return file_format
+    return default_format
+
+
+def infer_compression(output):
+    """ Compression implied by the output file extension """
+    if re.search(r'\.gz$', output or ''):
+        return 'gzip'
+    if re.search(r'\.zst$', output or ''):
+        return 'zstd'
+    return 'none'
+
+
+def import_optional(module_name, purpose):
+    try:
+        return __import__(module_name, fromlist=['_'])
+    except ImportError:
+        raise SystemExit("Python package '%s' is needed for %s: pip3 install %s" %
+                         (module_name.split('.')[0], purpose, module_name.split('.')[0]))
+
+
+class SpreadsheetWriter(object):
+    """
+    Writes DataFrames to the output, one after another: the header (or schema) is taken from the first, and the file
+    is finalised by close(). Standard output is used if the output is None, '-' or '/dev/stdout'.
+    """
+
+    def __init__(self, output, output_format, compression):
+        self.output = output
+        self.output_format = output_format
+        self.compression = compression
+        self.row_count = 0
+        self.chunk_count = 0
+        self.table_writer = None
+        self.schema = None
+        to_stdout = output in {None, '-', '/dev/stdout'}
+        self.raw_handle = sys.stdout.buffer if to_stdout else open(output, 'wb')
+        self.close_raw = not to_stdout
+        if output_format in {'csv', 'tsv'}:
+            if compression == 'gzip':
+                self.byte_handle = gzip.GzipFile(fileobj=self.raw_handle, mode='wb')
+            elif compression == 'zstd':
+                zstandard = import_optional('zstandard', 'zstd compression')
+                self.byte_handle = zstandard.ZstdCompressor().stream_writer(self.raw_handle, closefd=False)
+            else:
+                self.byte_handle = None
+            if self.byte_handle is None and to_stdout:
+                sys.stdout.flush()
+            self.text_handle = io.TextIOWrapper(self.byte_handle or self.raw_handle, encoding='utf-8', newline='',
+                                                write_through=True)
+        else:
+            self.pa = import_optional('pyarrow', 'Parquet and Arrow output')
+            if output_format == 'arrow' and compression == 'gzip':
+                raise SystemExit("Arrow output supports zstd compression, but not gzip")
+
+    def write(self, panda_chunk):
+        if self.output_format in {'csv', 'tsv'}:
+            panda_chunk.to_csv(self.text_handle, index=False, sep=',' if self.output_format == 'csv' else '\t',
+                               header=self.chunk_count == 0)
+        else:
+            table = self.pa.Table.from_pandas(panda_chunk, preserve_index=False)
+            if self.schema is None:
+                """ Columns with no values in the first chunk are taken to be strings, as new ontology columns are """
+                self.schema = self.pa.schema([
+                    self.pa.field(f.name, self.pa.string()) if table.column(i).null_count == len(table) else f
+                    for i, f in enumerate(table.schema)])
+                self.table_writer = self.open_table_writer()
+            try:
+                table = table.cast(self.schema)
+            except (self.pa.ArrowInvalid, self.pa.ArrowNotImplementedError) as cast_error:
+                raise SystemExit("Column types differ between chunks (%s): try a larger chunk size" % cast_error)
+            self.table_writer.write_table(table)
+        self.chunk_count += 1
+        self.row_count += len(panda_chunk)
+
+    def open_table_writer(self):
+        if self.output_format == 'parquet':
+            parquet = import_optional('pyarrow.parquet', 'Parquet output')
+            codec = {'gzip': 'gzip', 'zstd': 'zstd'}.get(self.compression, 'snappy')
+            return parquet.ParquetWriter(self.raw_handle, self.schema, compression=codec)
+        ipc_options = self.pa.ipc.IpcWriteOptions(compression='zstd' if self.compression == 'zstd' else None)
+        return self.pa.ipc.new_file(self.raw_handle, self.schema, options=ipc_options)
+
+    def close(self):
+        if self.output_format in {'csv', 'tsv'}:
+            self.text_handle.flush()
+            self.text_handle.detach()
+            if self.byte_handle is not None:
+                self.byte_handle.close()
+        elif self.table_writer is not None:
+            self.table_writer.close()
+        self.raw_handle.flush()
+        if self.close_raw:
+            self.raw_handle.close()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import numpy as np
+import os
+import pandas as pd
+import re
+from spotilities import newsflash
+import sys
+import time
+
+
+"""
+__PARAMETERS__ (to main program: all non-positional key/value pairs):
+
+    1. dump-file     : filepath of bulk OxO mapping export (csv or tsv, with a header row); required columns are
+                       'source', 'target' and 'distance', optional ones 'source_label' and 'target_label'
+    2. index-dir     : directory in which to write the compact mapping index
+    3. file-format   : dump file format: 'csv' or 'tsv'; default = inferred from file extension
+
+The index is a set of numpy arrays, sorted on source term, which ontomapper.py memory-maps (--oxo-index switch) in
+place of querying the OxO web service: a single index answers queries at any distance up to the largest in the dump.
+"""
+
+
+INDEX_ARRAYS = ['sources', 'source_labels', 'offsets', 'targets', 'target_labels', 'target_codes', 'distances']
+
+
+def build_index(dump_file, index_dir, separator):
+    """
+    Sort a bulk mapping dump on source term and write it out as flat arrays: mappings for the i-th source term are
+    rows offsets[i] to offsets[i + 1] of target_codes and distances, where target_codes index into targets
+    :param dump_file index_dir separator:
+    :return count of mappings indexed:
+    """
+    t0 = time.time()
+    newsflash("Reading mapping dump ...")
+    dump_df = pd.read_csv(dump_file, sep=separator, dtype=str, keep_default_na=False)
+    dump_df.columns = [c.strip().lower() for c in dump_df.columns]
+    for label_column in ['source_label', 'target_label']:
+        if label_column not in dump_df.columns:
+            dump_df[label_column] = ''
+    dump_df['distance'] = dump_df['distance'].astype(np.int8)
+    newsflash("Sorting %d mappings on source term ..." % len(dump_df))
+    dump_df = dump_df.sort_values(['source', 'distance'], kind='mergesort').reset_index(drop=True)
+
+    source_codes, sources = pd.factorize(dump_df['source'])
+    target_codes, targets = pd.factorize(dump_df['target'])
+    first_rows = np.flatnonzero(np.r_[True, source_codes[1:] != source_codes[:-1]])[:len(sources)]
+    first_targets = np.unique(target_codes, return_index=True)[1]
+    source_labels = dump_df['source_label'].values[first_rows]
+    target_labels = dump_df['target_label'].values[first_targets]
+    index_arrays = {
+        'sources': np.array([s.encode('utf-8') for s in sources], dtype=bytes),
+        'source_labels': np.array([s.encode('utf-8') for s in source_labels], dtype=bytes),
+        'offsets': np.r_[first_rows, len(dump_df)].astype(np.int64),
+        'targets': np.array([t.encode('utf-8') for t in targets], dtype=bytes),
+        'target_labels': np.array([t.encode('utf-8') for t in target_labels], dtype=bytes),
+        'target_codes': target_codes.astype(np.int32),
+        'distances': dump_df['distance'].values,
+    }
+    os.makedirs(index_dir, exist_ok=True)
+    for array_name in INDEX_ARRAYS:
+        np.save(os.path.join(index_dir, array_name + '.npy'), index_arrays[array_name])
+    with open(os.path.join(index_dir, 'index.json'), 'w') as index_meta:
+        json.dump({'dump_file': os.path.abspath(dump_file), 'source_count': len(sources),
+                   'target_count': len(targets), 'mapping_count': len(dump_df),
+                   'max_distance': int(dump_df['distance'].max()) if len(dump_df) else 0,
+                   'built': time.strftime('%Y-%m-%dT%H:%M:%S')}, index_meta)
+    newsflash("Indexed %d mappings from %d source terms to %d target terms, in %.2f seconds" %
+              (len(dump_df), len(sources), len(targets), float(time.time() - t0)))
+    return len(dump_df)
+
+
+def open_index(index_dir):
+    """
+    Memory-map a mapping index built by build_index
+    :param index_dir:
+    :return dictionary of (read-only, memory-mapped) index arrays:
+    """
+    index = {array_name: np.load(os.path.join(index_dir, array_name + '.npy'), mmap_mode='r')
+             for array_name in INDEX_ARRAYS}
+    with open(os.path.join(index_dir, 'index.json')) as index_meta:
+        index.update(json.load(index_meta))
+    newsflash("Opened offline mapping index of %d mappings, up to distance %d" %
+              (index['mapping_count'], index['max_distance']))
+    return index
+
+
+def curie_form(iri):
+    """ Best-guess CURIE for an OBO-style IRI (e.g. .../EFO_0000378 -> EFO:0000378), for dumps keyed on CURIEs """
+    short_form = re.split('[/#]', iri)[-1]
+    return short_form.replace('_', ':', 1) if '_' in short_form else None
+
+
+def map_iris_offline(iri_dict, target_ontologies, distance, index, verbose):
+    """
+    Drop-in replacement for map_iris, answering from an offline mapping index instead of the OxO web service: fills
+    the passed-in dictionary with the same {'source_label': ..., 'ontodict': ...} structure
+    """
+    if distance > index['max_distance']:
+        newsflash("Warning: offline index only holds mappings up to distance %d" % index['max_distance'])
+    targets = {t.lower() for t in target_ontologies}
+    sources = index['sources']
+    query_iris = list(iri_dict.keys())
+    """ Binary search for all source IRIs at once, then for the CURIE forms of any not found as IRIs """
+    positions = np.full(len(query_iris), -1, dtype=np.int64)
+    for key_of in [lambda iri: iri, curie_form]:
+        missing = [q for q in np.flatnonzero(positions < 0) if key_of(query_iris[q]) is not None]
+        keys = [key_of(query_iris[q]).encode('utf-8') for q in missing]
+        if not keys or len(sources) == 0:
+            continue
+        found_at = np.searchsorted(sources, np.array(keys, dtype=sources.dtype))
+        for q, key, position in zip(missing, keys, found_at):
+            if position < len(sources) and sources[position] == key:
+                positions[q] = position
+
+    target_cache = {}
+    for iri, position in zip(query_iris, positions):
+        if position < 0:
+            continue
+        ontology_dict = {}
+        start, stop = index['offsets'][position], index['offsets'][position + 1]
+        for target_code, hit_distance in zip(index['target_codes'][start:stop], index['distances'][start:stop]):
+            if hit_distance > distance:
+                continue
+            if target_code not in target_cache:
+                curie = index['targets'][target_code].decode('utf-8')
+                target_cache[target_code] = (curie, curie.split(':')[0],
+                                             index['target_labels'][target_code].decode('utf-8'))
+            curie, target_ontology, target_label = target_cache[target_code]
+            if target_ontology.lower() in targets:
+                ontology_dict.setdefault(target_ontology, []).append(
+                    {'curie': curie, 'target_label': target_label, 'distance': int(hit_distance)})
+        iri_dict[iri] = {'source_label': index['source_labels'][position].decode('utf-8'), 'ontodict': ontology_dict}
+        newsflash(iri_dict[iri], verbose)
+    newsflash("Offline mapping index: %d of %d source IRIs found" % (int((positions >= 0).sum()), len(query_iris)))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='OxO index builder',
+                                     description="%s%s" % ('Builds a compact, memory-mappable index from a bulk ',
+                                                           'export of OxO mappings, for offline use by ontomapper.py.'))
+    parser.add_argument('-i', '--dump-file', required=True,
+                        help="bulk mapping export, with header columns 'source', 'target', 'distance' %s" %
+                             "and (optionally) 'source_label', 'target_label'")
+    parser.add_argument('-x', '--index-dir', required=True, help='directory in which to write the index')
+    parser.add_argument('-f', '--file-format', choices=['csv', 'tsv'],
+                        help='dump file format; inferred from the file extension if omitted')
+
+    if len(sys.argv) < 2:
+        parser.print_help(sys.stderr)
+        newsflash()
+        sys.exit(0)
+
+    args = parser.parse_args()
+    file_format = args.file_format
+    if file_format is None:
+        file_format = 'csv' if re.search(r'\.csv(\.gz)?$', args.dump_file) else 'tsv'
+    build_index(args.dump_file, args.index_dir, ',' if file_format == 'csv' else '\t')
+
+
+if __name__ == "__main__":
+    main()
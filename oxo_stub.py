@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from spotilities import newsflash
+import sys
+import time
+import urllib.parse
+
+
+"""
+Local stand-in for the OxO web service, for benchmarking and offline testing of ontomapper.py.
+
+Mimics POST /api/search: form fields 'ids', 'mappingTarget' and 'distance', with '?size=' and '?page=' paging, and
+replies with '_embedded.searchResults' and '_links.next', as OxO does. Mappings are made up, but deterministic: each
+source IRI always gets the same hits (a hash of the IRI decides how many, in which target ontology, at what distance),
+so results are reproducible between runs. A fixed latency may be added to every reply, to imitate a remote server, and
+a loaded one may be imitated too, by failing a proportion of requests (503), and refusing over-large batches (413).
+"""
+
+
+TARGET_FORMATS = {'doid': ('DOID', '%07d'), 'mesh': ('MeSH', 'D%06d'), 'ncit': ('NCIT', 'C%05d'),
+                  'hp': ('HP', '%07d'), 'mondo': ('MONDO', '%07d'), 'umls': ('UMLS', 'C%07d')}
+
+
+def stub_hits(source_iri, target_ontologies, distance):
+    """ Deterministic, made-up OxO hits for a source IRI: None if the IRI is to be treated as unknown """
+    iri_hash = int(hashlib.md5(source_iri.encode('utf-8')).hexdigest(), 16)
+    if iri_hash % 17 == 0:
+        return None
+    targets = sorted(t.lower() for t in target_ontologies if t.lower() in TARGET_FORMATS)
+    hits = []
+    for h in range(iri_hash % 5 if targets else 0):
+        target = targets[(iri_hash >> (4 + h)) % len(targets)]
+        hit_distance = 1 + (iri_hash >> (8 + h)) % 3
+        if hit_distance > distance:
+            continue
+        prefix, id_format = TARGET_FORMATS[target]
+        hits.append({'curie': '%s:%s' % (prefix, id_format % ((iri_hash >> (12 + h)) % 99999)),
+                     'targetPrefix': prefix, 'label': '%s term %d' % (prefix, h), 'distance': hit_distance,
+                     'sourcePrefixes': [prefix]})
+    return hits
+
+
+def stub_handler(latency, failure_rate=0.0, max_ids=None):
+
+    class OxoStubHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            time.sleep(latency)
+            url = urllib.parse.urlparse(self.path)
+            if url.path.rstrip('/') != '/api/search':
+                self.send_error(404)
+                return
+            query = urllib.parse.parse_qs(url.query)
+            form = urllib.parse.parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            if random.random() < failure_rate:
+                self.send_error(503)
+                return
+            if max_ids is not None and len(form.get('ids', [])) > max_ids:
+                self.send_error(413)
+                return
+            size = int(query.get('size', ['20'])[0])
+            page = int(query.get('page', ['0'])[0])
+            distance = int(form.get('distance', ['1'])[0])
+            targets = form.get('mappingTarget', [])
+            search_results = []
+            for source_iri in form.get('ids', []):
+                hits = stub_hits(source_iri, targets, distance)
+                if hits is not None:
+                    search_results.append({'queryId': source_iri, 'querySource': None,
+                                           'curie': source_iri.rsplit('/', 1)[-1].replace('_', ':', 1),
+                                           'label': 'label of %s' % source_iri.rsplit('/', 1)[-1],
+                                           'mappingResponseList': hits})
+            reply = {'_embedded': {'searchResults': search_results[page * size:(page + 1) * size]},
+                     'page': {'size': size, 'totalElements': len(search_results),
+                              'totalPages': -(-len(search_results) // size), 'number': page}}
+            if (page + 1) * size < len(search_results):
+                next_query = urllib.parse.urlencode({'page': page + 1, 'size': size})
+                reply['_links'] = {'next': {'href': 'http://%s:%d%s?%s' % (
+                    self.server.server_address[0], self.server.server_address[1], url.path, next_query)}}
+            body = json.dumps(reply).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return OxoStubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='OxO stub',
+                                     description='Serves deterministic, made-up OxO search results on localhost.')
+    parser.add_argument('-p', '--port', type=int, default=8099, help='port to listen on')
+    parser.add_argument('-l', '--latency', type=float, default=0.0, help='seconds to wait before every reply')
+    parser.add_argument('-f', '--failure-rate', type=float, default=0.0,
+                        help='proportion of requests to fail with 503 Service Unavailable')
+    parser.add_argument('-m', '--max-ids', type=int, help='largest batch of source IRIs accepted (413 beyond that)')
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), stub_handler(args.latency, args.failure_rate, args.max_ids))
+    newsflash("OxO stub listening on http://127.0.0.1:%d/api/search ..." % args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import json
+import sqlite3
+import time
+
+
+"""
+Persistent, on-disk cache of OxO mappings, held in a SQLite database.
+
+One row is stored per (source IRI, target ontology, distance) triple, holding the source label and the list of hits in
+that target ontology, exactly as map_iris would have put them into the 'ontodict' of its IRI dictionary. Source IRIs
+that OxO did not return at all are cached too (with a null label), so that they are not re-queried on every run.
+"""
+
+
+def open_cache(cache_file):
+    """
+    Open (creating, if necessary) the SQLite mapping cache at the given filepath
+    :param cache_file:
+    :return cache_connection:
+    """
+    cache = sqlite3.connect(cache_file)
+    cache.execute("""CREATE TABLE IF NOT EXISTS oxo_mapping (
+                         source_iri TEXT NOT NULL,
+                         target TEXT NOT NULL,
+                         distance INTEGER NOT NULL,
+                         found INTEGER NOT NULL,
+                         source_label TEXT,
+                         rank INTEGER,
+                         hits TEXT,
+                         stored REAL NOT NULL,
+                         used REAL NOT NULL,
+                         PRIMARY KEY (source_iri, target, distance))""")
+    cache.execute("CREATE INDEX IF NOT EXISTS oxo_mapping_used ON oxo_mapping (used)")
+    cache.commit()
+    return cache
+
+
+def fetch_cached(cache, source_iris, target_ontologies, distance, ttl_hours):
+    """
+    Look up source IRIs in the cache: an IRI only counts as a hit if there is an unexpired entry for every one of the
+    target ontologies, at the given distance
+    :param cache source_iris target_ontologies distance ttl_hours:
+    :return dictionary of cached IRI map entries, keyed on source IRI (value None if OxO did not know the IRI):
+    """
+    now = time.time()
+    oldest = 0 if ttl_hours is None else now - ttl_hours * 3600
+    targets = [t.lower() for t in target_ontologies]
+    cached = {}
+    cursor = cache.cursor()
+    for source_iri in source_iris:
+        rows = cursor.execute("SELECT target, found, source_label, rank, hits FROM oxo_mapping "
+                              "WHERE source_iri = ? AND distance = ? AND stored >= ?",
+                              (source_iri, distance, oldest)).fetchall()
+        row_dict = {row[0]: row[1:] for row in rows}
+        if not all(t in row_dict for t in targets):
+            continue
+        if not all(row_dict[t][0] for t in targets):
+            cached[source_iri] = None
+            continue
+        ontology_dict = {}
+        """ Rebuild ontodict in the order in which OxO originally listed the target ontologies """
+        ranked = sorted((row_dict[t][2], row_dict[t][3]) for t in targets if row_dict[t][2] is not None)
+        for rank, hits in ranked:
+            hit_list = json.loads(hits)
+            ontology_dict[hit_list[0]['target_prefix']] = [
+                {'curie': h['curie'], 'target_label': h['target_label'], 'distance': h['distance']} for h in hit_list]
+        cached[source_iri] = {'source_label': row_dict[targets[0]][1], 'ontodict': ontology_dict}
+    cursor.executemany("UPDATE oxo_mapping SET used = ? WHERE source_iri = ? AND distance = ?",
+                       [(now, source_iri, distance) for source_iri in cached])
+    cache.commit()
+    return cached
+
+
+def store_cached(cache, iri_entries, target_ontologies, distance):
+    """
+    Write freshly retrieved IRI map entries into the cache, one row per target ontology
+    :param cache iri_entries target_ontologies distance:
+    :return count_of_rows_written:
+    """
+    now = time.time()
+    targets = [t.lower() for t in target_ontologies]
+    rows = []
+    for source_iri, entry in iri_entries.items():
+        if entry is None:
+            rows.extend((source_iri, t, distance, 0, None, None, None, now, now) for t in targets)
+            continue
+        ranked = {}
+        for rank, target_prefix in enumerate(entry['ontodict']):
+            ranked[target_prefix.lower()] = (rank, json.dumps(
+                [dict(hit, target_prefix=target_prefix) for hit in entry['ontodict'][target_prefix]]))
+        for t in targets:
+            rank, hits = ranked.get(t, (None, None))
+            rows.append((source_iri, t, distance, 1, entry['source_label'], rank, hits, now, now))
+    cache.executemany("INSERT OR REPLACE INTO oxo_mapping VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    cache.commit()
+    return len(rows)
+
+
+def evict_cached(cache, ttl_hours, max_rows):
+    """
+    Remove expired rows, then the least recently used rows beyond the maximum cache size
+    :param cache ttl_hours max_rows:
+    :return count_of_rows_evicted:
+    """
+    evicted = 0
+    if ttl_hours is not None:
+        evicted += cache.execute("DELETE FROM oxo_mapping WHERE stored < ?",
+                                 (time.time() - ttl_hours * 3600,)).rowcount
+    if max_rows is not None:
+        evicted += cache.execute("DELETE FROM oxo_mapping WHERE rowid IN "
+                                 "(SELECT rowid FROM oxo_mapping ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                                 (max_rows,)).rowcount
+    cache.commit()
+    return evicted
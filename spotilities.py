@@ -2,6 +2,16 @@
 
 import sys
 import configparser
+import hashlib
+import importlib.util
+import io
+import json
+import ontometrics
+import os
+import requests
+import tempfile
+import time
+import urllib.parse
 
 
 def newsflash(msg=None, verbose=True):
@@ -15,6 +25,22 @@ def newsflash(msg=None, verbose=True):
         sys.stderr.write("%s\n" % (msg))
 
 
+def lazy_import(module_name):
+    """
+    Return a module that is only actually imported when one of its attributes is first used, so that a script pays
+    for heavy imports (pandas, numpy) only on the code paths that need them
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    module_spec = importlib.util.find_spec(module_name)
+    lazy_loader = importlib.util.LazyLoader(module_spec.loader)
+    module_spec.loader = lazy_loader
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_name] = module
+    lazy_loader.exec_module(module)
+    return module
+
+
 def config_or_bust(cfg_object, cfg_section):
 
     def config_section_lookup(cfg_key, cfg_type):
@@ -29,12 +55,127 @@ def config_or_bust(cfg_object, cfg_section):
                 cfg_value = cfg_object.getboolean(cfg_section, cfg_key)
             else:
                 raise ValueError('cfg_type should be one of: string, int, float, boolean')
-        except configparser.NoSectionError:
+        except (configparser.NoSectionError, configparser.NoOptionError):
             cfg_value = None
         return cfg_value
     return config_section_lookup
 
 
+def fetch_spreadsheet(url, download_dir=None):
+    """
+    Stream a remote spreadsheet to a local file, rather than buffering it in memory. If a download directory is given,
+    the file is cached there, and revalidated on later calls (ETag / Last-Modified), so that an unchanged spreadsheet
+    costs only a '304 Not Modified' reply. Responses are requested gzip-encoded; remote '.gz' files are kept compressed.
+    :param url download_dir:
+    :return local_filepath:
+    """
+    with ontometrics.span('download') as download:
+        r, local_path, t0 = request_spreadsheet(url, download_dir)
+        download['status'] = r.status_code
+        if r.status_code != 304:
+            byte_count = 0
+            with open(local_path + '.part', 'wb') as local_file:
+                for block in iter(lambda: r.raw.read(1 << 20), b''):
+                    local_file.write(block)
+                    byte_count += len(block)
+    if r.status_code != 304:
+        finish_download(r, url, local_path, download_dir, byte_count, t0)
+    return local_path
+
+
+def request_spreadsheet(url, download_dir=None):
+    """
+    Send the request for a remote spreadsheet, revalidating any cached copy in the download directory
+    :return response (closed if the cached copy is current, with status 304), local filepath, and start time:
+    """
+    suffix = '.gz' if urllib.parse.urlparse(url).path.endswith('.gz') else ''
+    headers = {'Accept-Encoding': 'gzip'}
+    meta = {}
+    if download_dir is None:
+        local_fd, local_path = tempfile.mkstemp(suffix=suffix, prefix='ontomapper_')
+        os.close(local_fd)
+    else:
+        os.makedirs(download_dir, exist_ok=True)
+        local_path = os.path.join(download_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + suffix)
+        if os.path.exists(local_path) and os.path.exists(local_path + '.json'):
+            with open(local_path + '.json') as meta_file:
+                meta = json.load(meta_file)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+    t0 = time.time()
+    newsflash("Getting spreadsheet from URL ...")
+    r = requests.get(url, headers=headers, allow_redirects=True, stream=True)
+    if r.status_code == 304:
+        r.close()
+        newsflash("Spreadsheet unchanged since last download: %d bytes saved, in %.2f seconds" %
+                  (os.path.getsize(local_path), float(time.time() - t0)))
+        ontometrics.count('download_bytes_saved', os.path.getsize(local_path))
+    else:
+        r.raise_for_status()
+        r.raw.decode_content = True
+    return r, local_path, t0
+
+
+def finish_download(r, url, local_path, download_dir, byte_count, t0):
+    """ Move a completed download into place, recording its validators if cached, and report on it """
+    wire_count = r.raw.tell()
+    ontometrics.count('download_bytes', byte_count)
+    ontometrics.count('download_wire_bytes', wire_count)
+    os.replace(local_path + '.part', local_path)
+    if download_dir is not None:
+        with open(local_path + '.json', 'w') as meta_file:
+            json.dump({'url': url, 'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')},
+                      meta_file)
+    t1 = time.time()
+    newsflash("It took %.2f seconds to retrieve the spreadsheet: %d bytes (%.2f MB/s), %d bytes saved by compression" %
+              (float(t1 - t0), byte_count, byte_count / 1e6 / max(t1 - t0, 1e-6), max(byte_count - wire_count, 0)))
+
+
+class DownloadTee(io.RawIOBase):
+    """
+    Readable stream of a spreadsheet as it downloads, so that it may be parsed while still in transit: every block read
+    is also written to the local (cache) file, which is moved into place, as by fetch_spreadsheet, once the whole
+    spreadsheet has been read
+    """
+
+    def __init__(self, r, url, local_path, download_dir, t0):
+        self.r = r
+        self.url = url
+        self.local_path = local_path
+        self.download_dir = download_dir
+        self.t0 = t0
+        self.byte_count = 0
+        self.local_file = open(local_path + '.part', 'wb')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        block = self.r.raw.read(len(buffer))
+        if block:
+            self.local_file.write(block)
+            self.byte_count += len(block)
+            buffer[:len(block)] = block
+        elif not self.local_file.closed:
+            self.local_file.close()
+            finish_download(self.r, self.url, self.local_path, self.download_dir, self.byte_count, self.t0)
+        return len(block)
+
+
+def stream_spreadsheet(url, download_dir=None):
+    """
+    Alternative to fetch_spreadsheet, for parsing a remote spreadsheet while it downloads
+    :return buffered stream of the spreadsheet (None, if the cached copy is current), and its local filepath:
+    """
+    r, local_path, t0 = request_spreadsheet(url, download_dir)
+    if r.status_code == 304:
+        return None, local_path
+    return io.BufferedReader(DownloadTee(r, url, local_path, download_dir, t0), buffer_size=1 << 20), local_path
+
+
 def listify_uris(uri_string):
     """
     Take a comma-separated string of URIs and return a list of the same
@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 
 import argparse
-import io
 import configparser
+import csv
+import gzip
+import heapq
 import os
-import pandas as pd
+import random
 import re
-import requests
 from spotilities import newsflash
 from spotilities import config_or_bust
+from spotilities import fetch_spreadsheet
 import sys
-import time
 
 
 """
@@ -20,40 +21,111 @@ __PARAMETERS__ (to main program: all non-positional key/value pairs, to be initi
     2. output        : filename; default = standard output
     3. file-format   : input / output spreadsheet file format: 'csv' or 'tsv'; default = 'tsv'
     4. sample-size   : count of records required in output sample
+    5. seed          : random seed, for reproducible samples; default = none (different sample every run)
+    6. stratify      : optional column whose values define strata, each sampled in proportion to its size
+
+The spreadsheet is read in a single pass, with the csv module, and only the requested columns are kept: each record is
+given a random key, and the sample_size records with the lowest keys are retained (bottom-k reservoir sampling), so
+memory use is bounded by the sample, not the spreadsheet. With stratification, STRATIFIED_OVERSAMPLE times as many
+records are retained, over all strata, and the sample is allocated between strata in proportion to their sizes (largest
+remainder) at the end: the records retained of each stratum are those with its lowest keys, so each stratum's share is
+exactly its bottom-k sample, unless fewer of its records were retained than allotted (as may happen to small strata),
+when the shortfall is made up of the remaining retained records with the lowest keys, from any stratum. Sampled
+records are written out in their original order.
 """
 
 
-def sample_ss(input_file, output, file_format, sample_size, column_name):
-    ss_dict = {}
-    iri_map = {}
-    try:
-        # newsflash("Spreadsheet location is %s" % spreadsheet)
-        # newsflash("Column index is %d" % colno)
-        separator = "\t" if file_format == 'tsv' else ","
-
-        url_bool = re.compile('[a-zA-Z](\w|[-+.])*://.*')
-        # filestuff = None
-        if url_bool.match(input_file):
-            t0 = time.time()
-            newsflash("Getting spreadsheet from URL ...")
-            r = requests.get(input_file, allow_redirects=True)
-            t1 = time.time()
-            newsflash("It took %.2f seconds to retrieve the spreadsheet" % float(t1 - t0))
-            filestuff = io.StringIO(r.content.decode('utf-8'))
+""" Records retained per record sampled, with --stratify: headroom for strata faring worse than their share """
+STRATIFIED_OVERSAMPLE = 4
+
+
+def open_text(filestuff):
+    if filestuff.endswith('.gz'):
+        return gzip.open(filestuff, 'rt', newline='', encoding='utf-8')
+    return open(filestuff, newline='', encoding='utf-8')
+
+
+def allocate(stratum_counts, sample_size):
+    """ Share the sample between strata in proportion to their sizes, by the largest remainder method """
+    record_count = sum(stratum_counts.values())
+    if record_count == 0:
+        return {}
+    quotas = {stratum: float(sample_size) * count / record_count for stratum, count in stratum_counts.items()}
+    allocation = {stratum: int(quota) for stratum, quota in quotas.items()}
+    shortfall = min(sample_size, record_count) - sum(allocation.values())
+    by_remainder = sorted(quotas, key=lambda stratum: allocation[stratum] - quotas[stratum])
+    for stratum in by_remainder[:shortfall]:
+        allocation[stratum] += 1
+    return allocation
+
+
+def sample_ss(input_file, output, file_format, sample_size, column_name, download_dir, seed=None, stratify=None):
+    separator = "\t" if file_format == 'tsv' else ","
+    rng = random.Random(seed)
+    csv.field_size_limit(2 ** 31 - 1)
+
+    url_bool = re.compile('[a-zA-Z](\w|[-+.])*://.*')
+    if url_bool.match(input_file):
+        filestuff = fetch_spreadsheet(input_file, download_dir)
+    else:
+        filestuff = input_file
+
+    newsflash("Sampling records in a single pass ...")
+    """ Max-heap (by negated key) of the records with the lowest keys so far """
+    reservoir = []
+    reservoir_size = sample_size * (1 if stratify is None else STRATIFIED_OVERSAMPLE)
+    stratum_counts = {}
+    with open_text(filestuff) as source:
+        source_reader = csv.reader(source, delimiter=separator)
+        header = next(source_reader)
+        missing_columns = [c for c in column_name + ([stratify] if stratify else []) if c not in header]
+        if missing_columns:
+            newsflash("Column(s) not found in spreadsheet: %s" % ', '.join(missing_columns))
+            sys.exit(1)
+        column_indices = [header.index(c) for c in column_name]
+        stratum_index = None if stratify is None else header.index(stratify)
+        record_count = 0
+        for record in source_reader:
+            if not record:
+                continue
+            if len(record) < len(header):
+                record += [''] * (len(header) - len(record))
+            stratum = None if stratum_index is None else record[stratum_index]
+            stratum_counts[stratum] = stratum_counts.get(stratum, 0) + 1
+            key = rng.random()
+            if len(reservoir) < reservoir_size:
+                heapq.heappush(reservoir, (-key, record_count, stratum, [record[c] for c in column_indices]))
+            elif key < -reservoir[0][0]:
+                heapq.heapreplace(reservoir, (-key, record_count, stratum, [record[c] for c in column_indices]))
+            record_count += 1
+    if filestuff != input_file and download_dir is None:
+        os.remove(filestuff)
+    newsflash("Read %d records, in %d strat%s" % (record_count, len(stratum_counts),
+                                                  'um' if len(stratum_counts) == 1 else 'a'))
+
+    allocation = allocate(stratum_counts, sample_size)
+    sampled = []
+    spare = []
+    for entry in sorted(reservoir, reverse=True):
+        if allocation[entry[2]] > 0:
+            allocation[entry[2]] -= 1
+            sampled.append(entry)
         else:
-            filestuff = input_file
-
-        newsflash("Pandafying spreadsheet ...")
-        source_df = pd.read_csv(filestuff, sep=separator, low_memory=False, keep_default_na=False)
-
-        newsflash("Generating random sample of records ...")
-        output_df = source_df.sample(n=sample_size).loc[:, column_name]
-        print(output_df.to_csv(index=False, sep=separator))
-
-    except requests.exceptions.InvalidSchema as is_error:
-        """ pandas should have coped with distinguishing text file from URL already """
-        newsflash('Error retrieving spreadsheet?')
-        newsflash(is_error)
+            spare.append(entry)
+    shortfall = min(sample_size, record_count) - len(sampled)
+    if shortfall > 0:
+        newsflash("Strata short of %d records among those retained: made up from other strata" % shortfall)
+        sampled.extend(spare[:shortfall])
+    sampled.sort(key=lambda entry: entry[1])
+
+    to_stdout = output in {None, '-', '/dev/stdout'}
+    sample_output = sys.stdout if to_stdout else open(output, 'w', newline='', encoding='utf-8')
+    sample_writer = csv.writer(sample_output, delimiter=separator, lineterminator='\n')
+    sample_writer.writerow(column_name)
+    sample_writer.writerows(entry[3] for entry in sampled)
+    if not to_stdout:
+        sample_output.close()
+    newsflash("Written a sample of %d records" % len(sampled))
     return None
 
 
@@ -73,8 +145,9 @@ def main():
         ontoconfig.read(config_file)
         columns_plus = ontoconfig.items('Columns')
         spurious_columns = ontoconfig.items('DEFAULT')
-        real_columns = dict(set(columns_plus) - set(spurious_columns))
-        column_list = list(real_columns.values())
+        """ Keep the order of the config file, so that samples are reproducible with a fixed seed """
+        column_list = [column for column in columns_plus if column not in spurious_columns]
+        column_list = [column_value for column_key, column_value in column_list]
 
     """ Third of all, parse the rest of the switches, possibly using defaults from configuration file """
     parser2 = argparse.ArgumentParser(prog='Ontomapper',
@@ -85,8 +158,10 @@ def main():
     cfg_sect_lookup = config_or_bust(ontoconfig, 'Params')
     parser2.add_argument('-i', '--input-file', default=cfg_sect_lookup('input_file', 'string'),
                          help='location of input spreadsheet: accepts filepath or URL')
+    parser2.add_argument('-w', '--download-dir', default=cfg_sect_lookup('download_dir', 'string'),
+                         help='directory caching downloaded spreadsheets, revalidated with the server on each run')
     parser2.add_argument('-o', '--output', default=cfg_sect_lookup('output', 'string'),
-                         help='output spreadsheet filepath **NO CURRENT EFFECT**')
+                         help='output spreadsheet filepath (standard output if omitted)')
     parser2.add_argument('-f', '--file-format', choices=['csv', 'tsv'],
                          default=cfg_sect_lookup('file_format', 'string'),
                          help='file format (both input and output)')
@@ -94,6 +169,12 @@ def main():
                          help='number of records to return in randomly sampled spreadsheet')
     parser2.add_argument('-c', '--column-name', nargs='+', default=column_list,
                          help='space-separated list of column names required in sampled output')
+    parser2.add_argument('-r', '--seed', type=int, help='random seed, for a reproducible sample')
+    parser2.add_argument('-t', '--stratify',
+                         help="%s%s" % ('column (e.g. MAPPED_TRAIT_URI) by whose values the sample is stratified, ',
+                                        'proportionally: %d times sample-size records are held in memory, and strata '
+                                        'short of their share among them are made up from others'
+                                        % STRATIFIED_OVERSAMPLE))
 
     if len(sys.argv) < 2:
         parser2.print_help(sys.stderr)
@@ -108,7 +189,8 @@ def main():
     newsflash("These are your opening parameters:")
     newsflash()
     # newsflash("Length of args dictionary is %d" % len(arg_dict))
-    newsflash(pd.Series(arg_dict))
+    for arg_key in arg_dict:
+        newsflash("%-14s %s" % (arg_key, arg_dict[arg_key]))
     newsflash()
 
     """ config is still in arg_dict at this point """
@@ -116,7 +198,7 @@ def main():
 
     """ Don't check values of reserved options, which have no effect at the moment """
     active_arg_dict = arg_dict.copy()
-    for inactive_arg in ['output']:
+    for inactive_arg in ['output', 'download_dir', 'seed', 'stratify']:
         active_arg_dict.pop(inactive_arg)
     if None in active_arg_dict.values():
         newsflash()